@@ -0,0 +1,233 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from py2neo import Graph, Node, Relationship
+
+WOS_CSV_FILE = 'data/wos-jls-journal-network.csv'
+
+
+class CitationGraph:
+    """
+    In-memory copy of the Work and Author nodes and the CITES and CREATOR_OF relationships of a citation
+    graph, as sparse matrices over integer indices. Works are sorted by year, so that the works of a
+    period are a contiguous range of rows. Co-citation, bibliographic coupling and citation counts are
+    computed as sparse matrix products and can be turned into rows for add_rows_to_network().
+    """
+    def __init__(self, work_ids, work_years, author_props, author_identities, cites, creator_of,
+                 venue_props=(), published_in=(), exclude_author=None):
+        """
+        `cites`, `creator_of` and `published_in` are (citing work, cited work), (author, work) and
+        (work, venue) index pairs. Authors
+        for which `exclude_author(props)` is true are left out of all results, by default those with
+        the family name "no_author".
+        """
+        work_years = pd.to_numeric(pd.Series(work_years), errors='coerce').to_numpy(dtype=np.float64)
+        # sort the works by year, works without a year come last
+        order = np.argsort(np.where(np.isnan(work_years), np.inf, work_years), kind='stable')
+        position = np.empty(len(order), dtype=np.int64)
+        position[order] = np.arange(len(order))
+        self.work_ids = [work_ids[i] for i in order]
+        self.work_years = work_years[order]
+        self.author_props = list(author_props)
+        self.author_identities = list(author_identities)
+        exclude_author = exclude_author or (lambda props: props.get('family') == 'no_author')
+        self.valid_authors = np.array([not exclude_author(props) for props in self.author_props], dtype=bool)
+        num_works = len(self.work_ids)
+        num_authors = len(self.author_props)
+        cites = np.asarray(cites, dtype=np.int64).reshape(-1, 2)
+        creator_of = np.asarray(creator_of, dtype=np.int64).reshape(-1, 2)
+        self.cites = self._binary_matrix(position[cites[:, 0]], position[cites[:, 1]], (num_works, num_works))
+        self.creator_of = self._binary_matrix(creator_of[:, 0], position[creator_of[:, 1]], (num_authors, num_works))
+        self.venue_props = list(venue_props)
+        published_in = np.asarray(published_in, dtype=np.int64).reshape(-1, 2)
+        self.published_in = self._binary_matrix(published_in[:, 1], position[published_in[:, 0]],
+                                                (len(self.venue_props), num_works))
+        self._nodes = {}
+
+    @staticmethod
+    def _binary_matrix(rows, cols, shape):
+        matrix = sparse.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=shape)
+        # duplicate relationships count once
+        matrix.data[:] = 1
+        return matrix
+
+    @classmethod
+    def from_graph(cls, graph: Graph, **kwargs):
+        """
+        Load the citation graph from Neo4j, with one query per node and relationship type
+        """
+        works = graph.run("MATCH (w:Work) RETURN id(w) AS identity, w.id AS id, w.year AS year").to_data_frame()
+        authors = graph.run("MATCH (a:Author) RETURN id(a) AS identity, properties(a) AS props").to_data_frame()
+        cites = graph.run("MATCH (w:Work)-[:CITES]->(c:Work) RETURN id(w) AS citing, id(c) AS cited").to_data_frame()
+        creator_of = graph.run("MATCH (a:Author)-[:CREATOR_OF]->(w:Work) RETURN id(a) AS author, id(w) AS work") \
+            .to_data_frame()
+        venues = graph.run("MATCH (v:Venue) RETURN id(v) AS identity, properties(v) AS props").to_data_frame()
+        published_in = graph.run("MATCH (w:Work)-[:PUBLISHED_IN]->(v:Venue) RETURN id(w) AS work, id(v) AS venue") \
+            .to_data_frame()
+        work_index = pd.Series(np.arange(len(works)), index=works['identity'] if len(works) else [])
+        author_index = pd.Series(np.arange(len(authors)), index=authors['identity'] if len(authors) else [])
+        venue_index = pd.Series(np.arange(len(venues)), index=venues['identity'] if len(venues) else [])
+        return cls(list(works['id']) if len(works) else [],
+                   works['year'] if len(works) else [],
+                   list(authors['props']) if len(authors) else [],
+                   list(authors['identity']) if len(authors) else [],
+                   np.column_stack([work_index.reindex(cites['citing']), work_index.reindex(cites['cited'])])
+                   if len(cites) else [],
+                   np.column_stack([author_index.reindex(creator_of['author']), work_index.reindex(creator_of['work'])])
+                   if len(creator_of) else [],
+                   list(venues['props']) if len(venues) else [],
+                   np.column_stack([work_index.reindex(published_in['work']), venue_index.reindex(published_in['venue'])])
+                   if len(published_in) else [],
+                   **kwargs)
+
+    @classmethod
+    def from_csv(cls, file_path=WOS_CSV_FILE, **kwargs):
+        """
+        Load the citation graph from the WoS CSV imported by csv-to-neo4j.py, without the database.
+        As in the import, the first author of each work is its creator.
+        """
+        rows = pd.read_csv(file_path, usecols=['item_id', 'pubyear', 'source_title', 'first_author', 'item_id_cited'],
+                           dtype={'item_id': str, 'pubyear': 'Int64', 'source_title': str, 'first_author': str,
+                                  'item_id_cited': str})
+        years = rows.drop_duplicates('item_id', keep='last').set_index('item_id')['pubyear']
+        work_codes, work_ids = pd.factorize(pd.concat([rows['item_id'], rows['item_id_cited'].dropna()]))
+        citing = work_codes[:len(rows)]
+        cited = np.full(len(rows), -1, dtype=np.int64)
+        cited[rows['item_id_cited'].notna().to_numpy()] = work_codes[len(rows):]
+        has_cited = cited >= 0
+        author_codes, author_names = pd.factorize(rows['first_author'])
+        has_author = author_codes >= 0
+        venue_codes, venue_names = pd.factorize(rows['source_title'])
+        has_venue = venue_codes >= 0
+        return cls(list(work_ids),
+                   years.reindex(work_ids).astype('Float64').to_numpy(dtype=np.float64, na_value=np.nan),
+                   [{'display_name': name} for name in author_names],
+                   list(range(len(author_names))),
+                   np.column_stack([citing[has_cited], cited[has_cited]]),
+                   np.column_stack([author_codes[has_author], citing[has_author]]),
+                   [{'name': name} for name in venue_names],
+                   np.column_stack([citing[has_venue], venue_codes[has_venue]]),
+                   **kwargs)
+
+    def _work_range(self, year_start=None, year_end=None):
+        # the range of the rows of the works published in the given years
+        start = 0 if year_start is None else np.searchsorted(self.work_years, year_start, side='left')
+        if year_end is None:
+            end = len(self.work_years) if year_start is None else np.searchsorted(self.work_years, np.inf)
+        else:
+            end = np.searchsorted(self.work_years, year_end, side='right')
+        return start, end
+
+    def _citing_authors(self, year_start=None, year_end=None):
+        # (works citing in the period x authors of the cited works), the number of cited works per author
+        start, end = self._work_range(year_start, year_end)
+        return self.cites[start:end] @ self.creator_of.T, start, end
+
+    def _valid_pairs(self, matrix, directed=False):
+        # drop self-pairs and pairs with excluded authors, and for symmetric matrices, the lower triangle
+        matrix = (matrix if directed else sparse.triu(matrix, k=1)).tocoo()
+        keep = (matrix.row != matrix.col) & (matrix.data != 0) \
+            & self.valid_authors[matrix.row] & self.valid_authors[matrix.col]
+        return matrix.row[keep], matrix.col[keep], matrix.data[keep]
+
+    def citation_counts(self, year_start=None, year_end=None) -> np.ndarray:
+        """
+        Return the number of citations of each author by works published in the given years
+        """
+        citing_authors, _, _ = self._citing_authors(year_start, year_end)
+        counts = np.asarray(citing_authors.sum(axis=0)).ravel()
+        counts[~self.valid_authors] = 0
+        return counts
+
+    def venue_citation_counts(self, year_start=None, year_end=None) -> np.ndarray:
+        """
+        Return the number of citations of works in each venue by works published in the given years
+        """
+        start, end = self._work_range(year_start, year_end)
+        cited = np.asarray(self.cites[start:end].sum(axis=0)).ravel()
+        return self.published_in @ cited
+
+    def author_citations(self, year_start=None, year_end=None) -> sparse.csr_matrix:
+        """
+        Return the (citing author x cited author) matrix of the number of citations in works published in
+        the given years, without self-citations
+        """
+        citing_authors, start, end = self._citing_authors(year_start, year_end)
+        matrix = (self.creator_of[:, start:end] @ citing_authors).tocsr()
+        matrix.setdiag(0)
+        matrix.eliminate_zeros()
+        return matrix
+
+    def co_citation(self, year_start=None, year_end=None) -> sparse.csr_matrix:
+        """
+        Return the (author x author) matrix of the number of works published in the given years which
+        cite works of both authors
+        """
+        citing_authors, _, _ = self._citing_authors(year_start, year_end)
+        citing_authors.data[:] = 1
+        return (citing_authors.T @ citing_authors).tocsr()
+
+    def bibliographic_coupling(self, year_start=None, year_end=None) -> sparse.csr_matrix:
+        """
+        Return the (author x author) matrix of the number of works cited by works of both authors
+        published in the given years
+        """
+        start, end = self._work_range(year_start, year_end)
+        references = self.creator_of[:, start:end] @ self.cites[start:end]
+        references.data[:] = 1
+        return (references @ references.T).tocsr()
+
+    def author_node(self, index) -> Node:
+        if index not in self._nodes:
+            node = Node('Author', **self.author_props[index])
+            node.identity = self.author_identities[index]
+            self._nodes[index] = node
+        return self._nodes[index]
+
+    def pair_rows(self, matrix: sparse.spmatrix, rel_type: str, min_value=1, limit: int = None,
+                  node_values: np.ndarray = None, directed=False) -> list:
+        """
+        Turn an author matrix into rows with "a1", "rel" and "a2" columns, as returned by a query with
+        apoc.create.vRelationship(), for pairs with a value of at least `min_value`, highest first. Unless
+        `directed`, the matrix must be symmetric. `node_values` (e.g. citation_counts()) size the nodes.
+        """
+        rows, cols, values = self._valid_pairs(matrix, directed)
+        keep = values >= min_value
+        rows, cols, values = rows[keep], cols[keep], values[keep]
+        order = np.argsort(-values, kind='stable')[:limit]
+        rel_class = Relationship.type(rel_type)
+        result = []
+        for i, j, value in zip(rows[order], cols[order], values[order]):
+            a1, a2 = self.author_node(i), self.author_node(j)
+            value = int(value)
+            props = {'value': value, 'label': str(value)}
+            if not directed:
+                props['arrows'] = "from;to"
+            row = {'a1': a1, 'rel': rel_class(a1, a2, **props), 'a2': a2}
+            if node_values is not None:
+                row['a1_style'] = {'value': int(node_values[i])}
+                row['a2_style'] = {'value': int(node_values[j])}
+            result.append(row)
+        return result
+
+    def co_citation_rows(self, year_start=None, year_end=None, min_value=1, limit: int = None,
+                         node_values=False) -> list:
+        """
+        Return the co-citation network of the given years as rows for add_rows_to_network(), or as the
+        result of a `query` function of create_timeseries(). With `node_values`, the nodes are sized by
+        their citation count.
+        """
+        values = self.citation_counts(year_start, year_end) if node_values else None
+        return self.pair_rows(self.co_citation(year_start, year_end), "IS_COCITED_WITH", min_value, limit, values)
+
+    def bibliographic_coupling_rows(self, year_start=None, year_end=None, min_value=1, limit: int = None,
+                                    node_values=False) -> list:
+        values = self.citation_counts(year_start, year_end) if node_values else None
+        return self.pair_rows(self.bibliographic_coupling(year_start, year_end), "IS_COUPLED_WITH",
+                              min_value, limit, values)
+
+    def author_citation_rows(self, year_start=None, year_end=None, min_value=1, limit: int = None,
+                             node_values=False) -> list:
+        values = self.citation_counts(year_start, year_end) if node_values else None
+        return self.pair_rows(self.author_citations(year_start, year_end), "CITES", min_value, limit, values,
+                              directed=True)
@@ -1,41 +1,294 @@
 from py2neo import Node, Relationship
-from utils import get_graph
+from utils import get_graph, atomic_write
 from tqdm import tqdm
 import pandas as pd
+import numpy as np
 import argparse
-import math
+import hashlib
+import heapq
+import tempfile
+import json
+import time
+import csv
+import io
+import os
 
-# Parsing CLI arguments
-parser = argparse.ArgumentParser(description='Import CSV to Neo4j')
-parser.add_argument('--row-num', type=int, help='The row number to start from')
-args = parser.parse_args()
+CSV_FILE = 'data/wos-jls-journal-network.csv'
+CHECKPOINT_FILE = 'cache/wos-jls-journal-network.checkpoint.json'
 
-# Set up a link to the Neo4j database
-graph = get_graph("jls-journal-network")
+# The columns of the WoS CSV which are imported, with fixed types so that all chunks are parsed alike
+SCHEMA = {
+    'item_id': str,
+    'pubyear': 'Int64',
+    'item_title': str,
+    'source_title': str,
+    'first_author': str,
+    'item_id_cited': str,
+}
 
-# Delete all nodes and relationships in the graph if not resuming
-if args.row_num is None:
-    graph.delete_all()
+# The uniqueness constraints of the graph, which are also the keys of the nodes (syntax of Neo4j 4.4 and 5)
+CONSTRAINTS = [
+    "CREATE CONSTRAINT unique_work_id IF NOT EXISTS FOR (w:Work) REQUIRE w.id IS UNIQUE",
+    "CREATE CONSTRAINT unique_venue_name IF NOT EXISTS FOR (v:Venue) REQUIRE v.name IS UNIQUE",
+    "CREATE CONSTRAINT unique_author_display_name IF NOT EXISTS FOR (a:Author) REQUIRE a.display_name IS UNIQUE",
+]
 
-# Create unique constraints
-graph.run("CREATE CONSTRAINT unique_work_id IF NOT EXISTS ON (w:Work) ASSERT w.id IS UNIQUE")
-graph.run("CREATE CONSTRAINT unique_venue_name IF NOT EXISTS ON (v:Venue) ASSERT v.name IS UNIQUE")
-graph.run("CREATE CONSTRAINT unique_author_display_name IF NOT EXISTS ON (a:Author) ASSERT a.display_name IS UNIQUE")
+# Cypher queries for the bulk import, each of which takes a list of rows as $rows parameter
+BULK_QUERIES = {
+    'works': """
+        UNWIND $rows AS r
+        MERGE (w:Work {id: r.id})
+        SET w.year = coalesce(r.year, w.year), w.title = coalesce(r.title, w.title)""",
+    'cited_works': "UNWIND $rows AS id MERGE (:Work {id: id})",
+    'venues': "UNWIND $rows AS name MERGE (:Venue {name: name})",
+    'authors': "UNWIND $rows AS name MERGE (:Author {display_name: name})",
+    'published_in': """
+        UNWIND $rows AS r
+        MATCH (w:Work {id: r[0]}) MATCH (v:Venue {name: r[1]})
+        MERGE (w)-[:PUBLISHED_IN]->(v)""",
+    'creator_of': """
+        UNWIND $rows AS r
+        MATCH (a:Author {display_name: r[0]}) MATCH (w:Work {id: r[1]})
+        MERGE (a)-[:CREATOR_OF]->(w)""",
+    'cites': """
+        UNWIND $rows AS r
+        MATCH (w:Work {id: r[0]}) MATCH (c:Work {id: r[1]})
+        MERGE (w)-[:CITES]->(c)""",
+}
 
-# Import CSV
-df = pd.read_csv('data/wos-jls-journal-network.csv', low_memory=False)
 
-# Check if a row number is given, if not start from the beginning
-start_row = args.row_num if args.row_num else 0
+def to_value(value):
+    # convert numpy scalars and missing values to python values, which can be sent as query parameters
+    if pd.api.types.is_scalar(value) and pd.isnull(value):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
 
-# Use tqdm to display a progress bar
-for index, row in tqdm(df.iterrows(), total=df.shape[0]):
-    # Skip rows until the starting row
-    if index < start_row:
-        continue
 
+def file_fingerprint(file_path, block_size=1 << 20):
+    # a cheap hash of a large file: its size and its first and last block
+    h = hashlib.sha1(str(os.path.getsize(file_path)).encode())
+    with open(file_path, 'rb') as f:
+        h.update(f.read(block_size))
+        f.seek(max(0, os.path.getsize(file_path) - block_size))
+        h.update(f.read(block_size))
+    return h.hexdigest()
+
+
+def read_batches(file_path, batch_size, offset=None, skip_rows=0):
+    """
+    Read the CSV file in batches of `batch_size` rows, starting at byte `offset` (which must be at the
+    start of a row) or after the header, and skipping `skip_rows` rows. Yields each batch as a DataFrame
+    together with the byte offset of the row following it, so that a later run can seek to it directly.
+    Rows are split by tracking quotes, so quoted fields may contain line breaks.
+    """
+    with open(file_path, 'rb') as f:
+        header = f.readline()
+        if offset is None:
+            offset = len(header)
+        f.seek(offset)
+        lines = []
+        num_rows = 0
+        quotes = 0
+        for line in f:
+            offset += len(line)
+            lines.append(line)
+            quotes += line.count(b'"')
+            if quotes % 2 == 1:
+                # the row continues on the next line
+                continue
+            quotes = 0
+            if skip_rows > 0:
+                skip_rows -= 1
+                lines = []
+                continue
+            num_rows += 1
+            if num_rows == batch_size:
+                yield parse_rows(header, lines), offset
+                lines = []
+                num_rows = 0
+        if len(lines) > 0:
+            yield parse_rows(header, lines), offset
+
+
+def parse_rows(header, lines):
+    return pd.read_csv(io.BytesIO(header + b''.join(lines)), usecols=list(SCHEMA), dtype=SCHEMA)
+
+
+def load_checkpoint():
+    if os.path.exists(CHECKPOINT_FILE):
+        with open(CHECKPOINT_FILE, 'r') as f:
+            return json.load(f)
+    return None
+
+
+def save_checkpoint(checkpoint):
+    os.makedirs(os.path.dirname(CHECKPOINT_FILE), exist_ok=True)
+    atomic_write(CHECKPOINT_FILE, lambda f: json.dump(checkpoint, f), mode='w')
+
+
+def batch_parameters(rows: pd.DataFrame) -> dict:
+    """
+    Convert a batch of rows of the WoS CSV into the deduplicated parameters of BULK_QUERIES.
+    The resulting nodes and properties are the same as with import_row(), except that missing values
+    never remove a property: the year and title of a work are the last ones which are not missing.
+    """
+    works = {}
+    cited_works = {}
+    venues = {}
+    authors = {}
+    published_in = {}
+    creator_of = {}
+    cites = {}
+    for item_id, pubyear, title, source_title, first_author, item_id_cited in zip(
+            rows['item_id'], rows['pubyear'], rows['item_title'], rows['source_title'],
+            rows['first_author'], rows['item_id_cited']):
+        item_id = to_value(item_id)
+        work = works.setdefault(item_id, {'id': item_id, 'year': None, 'title': None})
+        if not pd.isnull(pubyear):
+            work['year'] = to_value(pubyear)
+        if not pd.isnull(title):
+            work['title'] = to_value(title)
+        if not pd.isnull(source_title):
+            venues[source_title] = None
+            published_in[(item_id, source_title)] = None
+        if not pd.isnull(first_author):
+            authors[first_author] = None
+            creator_of[(first_author, item_id)] = None
+        if not pd.isnull(item_id_cited):
+            item_id_cited = to_value(item_id_cited)
+            cited_works[item_id_cited] = None
+            cites[(item_id, item_id_cited)] = None
+    return {
+        'works': list(works.values()),
+        'cited_works': [item_id for item_id in cited_works if item_id not in works],
+        'venues': list(venues),
+        'authors': list(authors),
+        'published_in': [list(r) for r in published_in],
+        'creator_of': [list(r) for r in creator_of],
+        'cites': [list(r) for r in cites],
+    }
+
+
+def import_batch(graph, rows: pd.DataFrame):
+    # import a batch of rows in a single transaction
+    parameters = batch_parameters(rows)
+    tx = graph.begin()
+    for name, query in BULK_QUERIES.items():
+        if len(parameters[name]) > 0:
+            tx.run(query, rows=parameters[name])
+    graph.commit(tx)
+
+
+class UniqueRows:
+    """
+    Collects rows of strings and writes each distinct row once, in sorted order. The rows are kept in
+    memory in runs of at most `run_size` distinct rows, which are sorted and spilled to files in
+    `directory`, and merged when written (an external sort).
+    """
+    def __init__(self, directory, run_size):
+        self.directory = directory
+        self.run_size = run_size
+        self.rows = set()
+        self.runs = []
+
+    def add(self, row):
+        self.rows.add(tuple(row))
+        if len(self.rows) >= self.run_size:
+            self.spill()
+
+    def spill(self):
+        if len(self.rows) == 0:
+            return
+        run_file = os.path.join(self.directory, f'run-{id(self)}-{len(self.runs)}.csv')
+        with open(run_file, 'w', newline='', encoding='utf-8') as f:
+            csv.writer(f).writerows(sorted(self.rows))
+        self.runs.append(run_file)
+        self.rows = set()
+
+    def write(self, writer):
+        self.spill()
+        handles = [open(run_file, newline='', encoding='utf-8') for run_file in self.runs]
+        try:
+            last = None
+            for row in heapq.merge(*map(csv.reader, handles)):
+                if row != last:
+                    writer.writerow(row)
+                    last = row
+        finally:
+            for handle in handles:
+                handle.close()
+            for run_file in self.runs:
+                os.remove(run_file)
+
+
+def export_admin_import_files(export_dir, batch_size=10000, run_size=1000000):
+    """
+    Convert the CSV into node and relationship files for neo4j-admin import, writing the nodes of each
+    batch as it is read. The keys of CONSTRAINTS are used as ID spaces. Nodes are only deduplicated
+    within a batch, the remaining duplicates are skipped by neo4j-admin, which keeps the first one: a work
+    which is in several batches gets the properties of the first, and works.csv is imported before
+    works-cited.csv with the works which are only cited. Relationships, which neo4j-admin does not
+    deduplicate, are deduplicated with an external sort in runs of `run_size` rows.
+    Returns the import command lines for Neo4j 4.4 and 5, keyed by version.
+    """
+    os.makedirs(export_dir, exist_ok=True)
+    files = {
+        'works': ['id:ID(Work)', 'year:int', 'title'],
+        'works-cited': ['id:ID(Work)'],
+        'venues': ['name:ID(Venue)'],
+        'authors': ['display_name:ID(Author)'],
+        'published_in': [':START_ID(Work)', ':END_ID(Venue)'],
+        'creator_of': [':START_ID(Author)', ':END_ID(Work)'],
+        'cites': [':START_ID(Work)', ':END_ID(Work)'],
+    }
+    relationships = ['published_in', 'creator_of', 'cites']
+    handles = {name: open(os.path.join(export_dir, f'{name}.csv'), 'w', newline='', encoding='utf-8')
+               for name in files}
+    writers = {name: csv.writer(handles[name]) for name in files}
+    for name, header in files.items():
+        writers[name].writerow(header)
+
+    try:
+        with tempfile.TemporaryDirectory(dir=export_dir) as run_dir:
+            unique_rows = {name: UniqueRows(run_dir, run_size) for name in relationships}
+            progress = tqdm(total=os.path.getsize(CSV_FILE), unit='B', unit_scale=True)
+            for rows, next_offset in read_batches(CSV_FILE, batch_size):
+                parameters = batch_parameters(rows)
+                writers['works'].writerows([work['id'], work['year'], work['title']]
+                                           for work in parameters['works'])
+                writers['works-cited'].writerows([item_id] for item_id in parameters['cited_works'])
+                writers['venues'].writerows([venue] for venue in parameters['venues'])
+                writers['authors'].writerows([author] for author in parameters['authors'])
+                for name in relationships:
+                    for row in parameters[name]:
+                        unique_rows[name].add(row)
+                progress.update(next_offset - progress.n)
+            progress.close()
+            for name in relationships:
+                unique_rows[name].write(writers[name])
+    finally:
+        for handle in handles.values():
+            handle.close()
+
+    with open(os.path.join(export_dir, 'constraints.cypher'), 'w') as f:
+        f.write(";\n".join(CONSTRAINTS) + ";\n")
+    options = " ".join([
+        "--multiline-fields=true --skip-duplicate-nodes=true --skip-bad-relationships=true",
+        "--nodes=Work=works.csv --nodes=Work=works-cited.csv",
+        "--nodes=Venue=venues.csv --nodes=Author=authors.csv",
+        "--relationships=PUBLISHED_IN=published_in.csv",
+        "--relationships=CREATOR_OF=creator_of.csv",
+        "--relationships=CITES=cites.csv",
+    ])
+    return {
+        '4.4': f"neo4j-admin import --database=jls-journal-network {options}",
+        '5': f"neo4j-admin database import full {options} jls-journal-network",
+    }
+
+
+def import_row(graph, row):
     # Create nodes
-    work = Node("Work", id=row['item_id'], year=row['pubyear'], title=row['item_title'])
+    work = Node("Work", id=row['item_id'], year=to_value(row['pubyear']), title=row['item_title'])
     work.__primarylabel__ = "Work"
     work.__primarykey__ = "id"
 
@@ -68,3 +321,76 @@ for index, row in tqdm(df.iterrows(), total=df.shape[0]):
 
     # Write to Neo4j database
     graph.merge(work, "Work", "id")
+
+
+if __name__ == "__main__":
+    # Parsing CLI arguments
+    parser = argparse.ArgumentParser(description='Import CSV to Neo4j')
+    parser.add_argument('--row-num', type=int, help='The row number to start from')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='The number of rows imported in one transaction')
+    parser.add_argument('--row-by-row', action='store_true',
+                        help='Merge each row separately instead of importing batches')
+    parser.add_argument('--restart', action='store_true',
+                        help='Ignore the checkpoint of a previous run and import everything again')
+    parser.add_argument('--export-dir', type=str,
+                        help='Do not import, but write files for neo4j-admin import to this directory')
+    args = parser.parse_args()
+
+    if args.export_dir is not None:
+        commands = export_admin_import_files(args.export_dir)
+        print(f"Files written to {args.export_dir}. Import them with the command for your Neo4j version, run in")
+        print(f"that directory, and create the uniqueness constraints in {args.export_dir}/constraints.cypher afterwards:")
+        for version, command in commands.items():
+            print(f"Neo4j {version}: {command}")
+        exit(0)
+
+    # Resume from the checkpoint of an interrupted run, if it was made for the same file
+    fingerprint = file_fingerprint(CSV_FILE)
+    checkpoint = load_checkpoint()
+    resume = (checkpoint is not None and checkpoint['fingerprint'] == fingerprint
+              and args.row_num is None and not args.restart)
+    if resume and checkpoint['done']:
+        print(f"{CSV_FILE} has already been imported, use --restart to import it again")
+        exit(0)
+
+    # Set up a link to the Neo4j database
+    graph = get_graph("jls-journal-network")
+
+    # Delete all nodes and relationships in the graph if not resuming
+    if args.row_num is None and not resume:
+        graph.delete_all()
+
+    # Create unique constraints
+    for constraint in CONSTRAINTS:
+        graph.run(constraint)
+
+    # Import CSV in batches, starting either at the checkpoint or at the given row number
+    if resume:
+        offset, num_rows, skip_rows = checkpoint['offset'], checkpoint['rows'], 0
+        print(f"Resuming import at row {num_rows}")
+    else:
+        offset, num_rows, skip_rows = None, 0, args.row_num or 0
+
+    start_time = time.time()
+    imported_rows = 0
+    progress = tqdm(total=os.path.getsize(CSV_FILE), initial=offset or 0, unit='B', unit_scale=True)
+    for rows, next_offset in read_batches(CSV_FILE, args.batch_size, offset, skip_rows):
+        batch_time = time.time()
+        if args.row_by_row:
+            for index, row in rows.iterrows():
+                import_row(graph, row)
+        else:
+            import_batch(graph, rows)
+        num_rows += len(rows) + skip_rows
+        skip_rows = 0
+        imported_rows += len(rows)
+        save_checkpoint({'file': CSV_FILE, 'fingerprint': fingerprint, 'offset': next_offset,
+                         'rows': num_rows, 'done': False})
+        progress.update(next_offset - progress.n)
+        progress.set_postfix(row=num_rows, batch_rows_per_s=round(len(rows) / (time.time() - batch_time)))
+    progress.close()
+    save_checkpoint({'file': CSV_FILE, 'fingerprint': fingerprint, 'offset': progress.n,
+                     'rows': num_rows, 'done': True})
+    duration = time.time() - start_time
+    print(f"Imported {imported_rows} rows in {duration:.1f}s ({imported_rows / max(duration, 1e-6):.0f} rows/s)")
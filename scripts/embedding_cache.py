@@ -0,0 +1,102 @@
+import os
+import json
+import hashlib
+import numpy as np
+from tqdm.notebook import tqdm
+
+from scripts.utils import atomic_write
+
+
+def document_hash(document: str) -> str:
+    return hashlib.sha1(document.encode('utf-8')).hexdigest()
+
+
+class EmbeddingStore:
+    """
+    Persistent store of the sentence embeddings of documents computed with one model, keyed by the hash of
+    the document text. The vectors are appended to a float32 file which is read as a memory-mapped array,
+    the index (document hash -> row) is a JSON file which is only replaced once the vectors are written, so
+    that vectors of an interrupted run are ignored. The encoder is only loaded if documents are missing.
+    """
+    def __init__(self, model_name: str, cache_dir='cache/embeddings', model=None):
+        """
+        `model` is an already loaded SentenceTransformer for `model_name`, otherwise it is loaded when needed
+        """
+        self.model_name = model_name
+        self.directory = os.path.join(cache_dir, model_name.replace('/', '__'))
+        self.vectors_file = os.path.join(self.directory, 'vectors.f32')
+        self.index_file = os.path.join(self.directory, 'index.json')
+        self._model = model
+        self.dimension = None
+        self.index = {}
+        if os.path.exists(self.index_file):
+            with open(self.index_file) as f:
+                data = json.load(f)
+            self.dimension = data['dimension']
+            self.index = data['index']
+        self._vectors = None
+
+    @property
+    def model(self):
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, document: str):
+        return document_hash(document) in self.index
+
+    @property
+    def vectors(self) -> np.ndarray:
+        # the stored vectors of the index, memory-mapped read-only
+        if self._vectors is None or len(self._vectors) != len(self.index):
+            if len(self.index) == 0:
+                return np.zeros((0, self.dimension or 0), dtype=np.float32)
+            self._vectors = np.memmap(self.vectors_file, dtype=np.float32, mode='r',
+                                      shape=(len(self.index), self.dimension))
+        return self._vectors
+
+    def _append(self, hashes, vectors: np.ndarray):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.dimension is None:
+            self.dimension = vectors.shape[1]
+        elif vectors.shape[1] != self.dimension:
+            raise ValueError(f"Embeddings of {self.model_name} have {self.dimension} dimensions, not {vectors.shape[1]}")
+        os.makedirs(self.directory, exist_ok=True)
+        self._vectors = None
+        with open(self.vectors_file, 'ab') as f:
+            # drop the vectors of an interrupted run which are not in the index
+            f.truncate(len(self.index) * self.dimension * 4)
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        for sha1 in hashes:
+            self.index[sha1] = len(self.index)
+        atomic_write(self.index_file, lambda f: json.dump({'model': self.model_name, 'dimension': self.dimension,
+                                                           'index': self.index}, f), mode='w')
+
+    def embed(self, documents, batch_size=32, chunk_size=1000, show_progress_bar=True) -> np.ndarray:
+        """
+        Return the embeddings of the documents, as passed as `embeddings` to BERTopic.fit_transform() and
+        visualize_documents(). Only documents which are not stored yet are encoded, in chunks of `chunk_size`
+        documents which are stored as soon as they are encoded.
+        """
+        hashes = [document_hash(document) for document in documents]
+        missing = {}
+        for sha1, document in zip(hashes, documents):
+            if sha1 not in self.index:
+                missing.setdefault(sha1, document)
+        missing_hashes = list(missing)
+        with tqdm(total=len(missing_hashes), desc=f"Encoding with {self.model_name}",
+                  disable=not show_progress_bar or len(missing_hashes) == 0) as progress:
+            for start in range(0, len(missing_hashes), chunk_size):
+                chunk = missing_hashes[start:start + chunk_size]
+                vectors = self.model.encode([missing[sha1] for sha1 in chunk], batch_size=batch_size,
+                                            convert_to_numpy=True, show_progress_bar=False)
+                self._append(chunk, vectors)
+                progress.update(len(chunk))
+        rows = np.fromiter((self.index[sha1] for sha1 in hashes), dtype=np.int64, count=len(hashes))
+        return np.asarray(self.vectors[rows])
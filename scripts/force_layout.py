@@ -0,0 +1,142 @@
+import numpy as np
+
+
+def _repulsion(pos, mass, other_pos, other_mass, repulsion):
+    # the repulsion of the nodes (pos, mass) by the other nodes, in proportion to both masses
+    delta = pos[:, None, :] - other_pos[None, :, :]
+    dist2 = (delta ** 2).sum(axis=2) + 1e-9
+    factor = repulsion * mass[:, None] * other_mass[None, :] / dist2
+    return (delta * factor[:, :, None]).sum(axis=1)
+
+
+def _cells(unit, side):
+    # the (x, y) grid coordinates and the index of the cell of each node, on a grid of side x side cells
+    xy = np.minimum((unit * side).astype(np.int64), side - 1)
+    return xy, xy[:, 0] * side + xy[:, 1]
+
+
+def _grid_repulsion(pos, mass, repulsion, nodes_per_cell, max_depth=10, chunk_size=5000):
+    """
+    Approximate the repulsion between all pairs of nodes on a hierarchy of grids (a quadtree), as in
+    Barnes-Hut: nodes in the same or adjacent cells of the finest grid repel each other exactly; the nodes
+    of other cells act as one node at their center of mass, using the coarsest grid level at which the
+    cell is not adjacent to the cell of the node. The finest grid is chosen so that a node shares its cell
+    with about `nodes_per_cell` nodes on average.
+    """
+    num_nodes = len(pos)
+    low = pos.min(axis=0)
+    unit = (pos - low) / ((pos.max(axis=0) - low).max() + 1e-9)
+    depth = 1
+    while depth < max_depth:
+        _, cell = _cells(unit, 2 ** depth)
+        if (np.bincount(cell).astype(np.float64) ** 2).sum() / num_nodes <= nodes_per_cell:
+            break
+        depth += 1
+
+    force = np.zeros_like(pos)
+    for level in range(2, depth + 1):
+        side = 2 ** level
+        xy, cell = _cells(unit, side)
+        cell_mass = np.bincount(cell, weights=mass, minlength=side * side)
+        centers = np.column_stack([np.bincount(cell, weights=mass * pos[:, 0], minlength=side * side),
+                                   np.bincount(cell, weights=mass * pos[:, 1], minlength=side * side)])
+        occupied = cell_mass > 0
+        centers[occupied] /= cell_mass[occupied, None]
+        # the cells which are not adjacent to the cell of a node, but whose parents are adjacent to its parent,
+        # by offset along each axis
+        x, y = xy[:, 0], xy[:, 1]
+        valid_x = {d: (x + d >= 0) & (x + d < side) & (np.abs((x + d) // 2 - x // 2) <= 1) for d in range(-3, 4)}
+        valid_y = {d: (y + d >= 0) & (y + d < side) & (np.abs((y + d) // 2 - y // 2) <= 1) for d in range(-3, 4)}
+        for dx in range(-3, 4):
+            for dy in range(-3, 4):
+                if max(abs(dx), abs(dy)) <= 1:
+                    continue
+                valid = valid_x[dx] & valid_y[dy]
+                other_cell = np.where(valid, (x + dx) * side + y + dy, 0)
+                delta = pos - centers[other_cell]
+                factor = repulsion * mass * cell_mass[other_cell] * valid / ((delta ** 2).sum(axis=1) + 1e-9)
+                force += delta * factor[:, None]
+
+    # exact repulsion of the nodes in the same and adjacent cells of the finest grid
+    side = 2 ** depth
+    xy, cell = _cells(unit, side)
+    order = np.argsort(cell, kind='stable')
+    sorted_cells = cell[order]
+    for start in range(0, num_nodes, chunk_size):
+        chunk = np.arange(start, min(start + chunk_size, num_nodes))
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                other = xy[chunk] + (dx, dy)
+                valid = ((other >= 0) & (other < side)).all(axis=1)
+                nodes = chunk[valid]
+                other_cell = other[valid, 0] * side + other[valid, 1]
+                first = np.searchsorted(sorted_cells, other_cell, side='left')
+                counts = np.searchsorted(sorted_cells, other_cell, side='right') - first
+                i = np.repeat(nodes, counts)
+                j = order[np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())]
+                delta = pos[i] - pos[j]
+                factor = repulsion * mass[i] * mass[j] / ((delta ** 2).sum(axis=1) + 1e-9)
+                force[:, 0] += np.bincount(i, weights=delta[:, 0] * factor, minlength=num_nodes)
+                force[:, 1] += np.bincount(i, weights=delta[:, 1] * factor, minlength=num_nodes)
+    return force
+
+
+def force_atlas2_layout(num_nodes: int,
+                        edges,
+                        weights=None,
+                        positions: np.ndarray = None,
+                        seed: int = None,
+                        iterations: int = 300,
+                        repulsion: float = 1.0,
+                        gravity: float = 0.1,
+                        anchor_strength: float = 1.0,
+                        chunk_size: int = 1000,
+                        exact_limit: int = 1000,
+                        nodes_per_cell: int = 10) -> np.ndarray:
+    """
+    Compute a force-directed layout in the style of ForceAtlas2 and return an array (num_nodes x 2)
+    of coordinates. Nodes repel each other in proportion to their degrees, edges (pairs of node indices)
+    attract their nodes in proportion to their weight, and gravity keeps unconnected components together.
+    `positions` may give initial coordinates (NaN for unknown nodes); these nodes are additionally drawn
+    to their initial position by `anchor_strength`, so that they don't move much. The random initial
+    coordinates of the other nodes are determined by `seed`, so the layout is deterministic.
+    Up to `exact_limit` nodes, the repulsion between all pairs of nodes is computed exactly, which is
+    quadratic in the number of nodes; larger networks use a Barnes-Hut approximation (see _grid_repulsion()).
+    """
+    rng = np.random.default_rng(seed)
+    pos = rng.normal(scale=np.sqrt(num_nodes + 1), size=(num_nodes, 2))
+    known = np.zeros(num_nodes, dtype=bool)
+    if positions is not None:
+        known = ~np.isnan(positions).any(axis=1)
+        pos[known] = positions[known]
+        anchors = positions[known]
+    edges = np.asarray(edges, dtype=np.int64).reshape(-1, 2)
+    weights = np.ones(len(edges)) if weights is None else np.asarray(weights, dtype=np.float64)
+    mass = np.bincount(edges.ravel(), minlength=num_nodes).astype(np.float64) + 1
+
+    # the maximum displacement per iteration, which is lowered step by step
+    temperature = np.sqrt(num_nodes + 1)
+    cooling = 0.01 ** (1 / max(iterations, 1))
+    for _ in range(iterations):
+        if num_nodes > exact_limit:
+            force = _grid_repulsion(pos, mass, repulsion, nodes_per_cell)
+        else:
+            force = np.zeros_like(pos)
+            # repulsion between all pairs of nodes, computed in chunks to limit memory use
+            for start in range(0, num_nodes, chunk_size):
+                force[start:start + chunk_size] = _repulsion(pos[start:start + chunk_size],
+                                                             mass[start:start + chunk_size], pos, mass, repulsion)
+        # attraction along the edges
+        delta = (pos[edges[:, 0]] - pos[edges[:, 1]]) * weights[:, None]
+        np.add.at(force, edges[:, 0], -delta)
+        np.add.at(force, edges[:, 1], delta)
+        # gravity towards the center, growing with the distance ("strong gravity" of ForceAtlas2)
+        force -= gravity * mass[:, None] * pos
+        if known.any():
+            force[known] -= anchor_strength * mass[known, None] * (pos[known] - anchors)
+        # move the nodes, but not further than the current temperature
+        displacement = force / mass[:, None]
+        length = np.linalg.norm(displacement, axis=1, keepdims=True) + 1e-9
+        pos += displacement / length * np.minimum(length, temperature)
+        temperature *= cooling
+    return pos
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import pandas as pd
+from py2neo import Graph
+
+from scripts.utils import get_graph, atomic_write, is_write_query
+
+# The indexes needed by the queries in the notebooks, in addition to the uniqueness constraints of the import
+INDEXES = {
+    'jls3': [
+        "CREATE INDEX work_year IF NOT EXISTS FOR (w:Work) ON (w.year)",
+        "CREATE INDEX work_container IF NOT EXISTS FOR (w:Work) ON (w.container)",
+        "CREATE INDEX venue_id IF NOT EXISTS FOR (v:Venue) ON (v.id)",
+        "CREATE INDEX author_family IF NOT EXISTS FOR (a:Author) ON (a.family)",
+    ],
+    'jls-journal-network': [
+        "CREATE INDEX work_year IF NOT EXISTS FOR (w:Work) ON (w.year)",
+    ],
+}
+
+BASELINE_FILE = 'cache/query-profile-baseline.json'
+
+# Read-only queries of the notebooks which are profiled, by database and name, with their parameters
+PROFILE_QUERIES = {}
+
+
+def register_query(database: str, name: str, query: str, **params):
+    if is_write_query(query):
+        raise ValueError(f"Query '{name}' writes to the database and cannot be profiled")
+    PROFILE_QUERIES.setdefault(database, {})[name] = (query, params)
+
+
+register_query('jls3', 'most_cited_authors', """
+    MATCH (citingWork:Work)-[r:CITES]->(citedWork:Work)<-[:CREATOR_OF]-(citedAuthor:Author)
+    WHERE citedAuthor.family <> "no_author"
+    RETURN citedAuthor.display_name AS author, count(*) AS citations
+    ORDER BY citations DESC
+    LIMIT 30""")
+register_query('jls3', 'most_published_authors', """
+    MATCH (a1:Author)-[:CREATOR_OF]->(w:Work)
+    WHERE a1.family <> "no_author"
+        AND w.year >= $year_start AND w.year <= $year_end
+        AND ((w)-[:PUBLISHED_IN]->(:Venue {id: 'j law soc'}) OR (w)-[:PUBLISHED_IN]->(:Venue {id: 'br j law soc'}))
+    RETURN a1.display_name AS author, count(DISTINCT w) AS count
+    ORDER BY count DESC
+    LIMIT 20""", year_start=1994, year_end=2003)
+register_query('jls3', 'co_citation_decade', """
+    MATCH (a1:Author)-[:CREATOR_OF]->(:Work)<-[:CITES]-(w:Work)-[:CITES]->(:Work)<-[:CREATOR_OF]-(a2:Author)
+    WHERE id(a1) < id(a2)
+        AND a1.family <> "no_author" AND a2.family <> "no_author"
+        AND w.year >= $year_start AND w.year <= $year_end
+    WITH a1, a2, count(DISTINCT w) AS co_citations
+    WHERE co_citations >= 5
+    RETURN a1.display_name, a2.display_name, co_citations""", year_start=1994, year_end=2003)
+register_query('jls-journal-network', 'journals_cited_by_jls', """
+    MATCH (citingWork:Work)-[r:CITES]->(:Work)-[:PUBLISHED_IN]-(citedVenue:Venue)
+    WHERE exists((citingWork)-[:PUBLISHED_IN]->(:Venue {name: "JOURNAL OF LAW AND SOCIETY"}))
+    RETURN toLower(citedVenue.name) AS journal, count(r) AS citations
+    ORDER BY citations DESC
+    LIMIT 20""")
+register_query('jls-journal-network', 'journal_citations_decade', """
+    MATCH (citingVenue:Venue)<-[:PUBLISHED_IN]-(citingWork:Work)-[:CITES]->(:Work)-[:PUBLISHED_IN]->(citedVenue:Venue)
+    WHERE citingWork.year >= $year_start AND citingWork.year <= $year_end AND citingVenue <> citedVenue
+    RETURN citingVenue.name, citedVenue.name, count(*) AS citations""", year_start=2004, year_end=2013)
+
+
+def apply_indexes(graph: Graph, timeout=300) -> list:
+    """
+    Create the missing indexes of the database (existing ones are left alone) and wait until they are online.
+    Returns the statements which were run.
+    """
+    statements = INDEXES.get(graph.name, [])
+    for statement in statements:
+        graph.run(statement)
+    graph.run("CALL db.awaitIndexes($timeout)", timeout=timeout)
+    return statements
+
+
+def schema(graph: Graph) -> list:
+    # the indexes of the database (including those backing constraints), to see whether the schema changed
+    indexes = graph.run("SHOW INDEXES YIELD name, labelsOrTypes, properties, state").data()
+    return sorted(f"{i['name']}:{i['labelsOrTypes']}:{i['properties']}:{i['state']}" for i in indexes)
+
+
+def sum_db_hits(plan) -> int:
+    # the db hits of all operators of a profiled plan
+    if not isinstance(plan, dict):
+        return 0
+    hits = plan.get('dbHits', plan.get('db_hits', 0)) or 0
+    return hits + sum(sum_db_hits(child) for child in plan.get('children', []))
+
+
+def profile_query(graph: Graph, query: str, params: dict = None, runs=3) -> dict:
+    """
+    Run the query under PROFILE and return its db hits, number of rows and the shortest wall time of `runs` runs
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        cursor = graph.run("PROFILE " + query, params or {})
+        rows = sum(1 for _ in cursor)
+        times.append(time.perf_counter() - start)
+    return {'db_hits': sum_db_hits(cursor.plan()), 'rows': rows, 'time': min(times)}
+
+
+def profile_queries(database: str, baseline_file=BASELINE_FILE, update=False, tolerance=0.2,
+                    min_time=0.05, runs=3) -> pd.DataFrame:
+    """
+    Profile the registered queries of the database and compare them with the baseline. A query is flagged as
+    regression if it needs more than `tolerance` (relative) more db hits or time than in the baseline (time
+    differences below `min_time` seconds are ignored), or returns a different number of rows. With `update`,
+    or if there is no baseline yet for the database, the results become the new baseline.
+    """
+    graph = get_graph(database)
+    baselines = {}
+    if os.path.exists(baseline_file):
+        with open(baseline_file) as f:
+            baselines = json.load(f)
+    baseline = baselines.get(database)
+    current_schema = schema(graph)
+    if baseline is not None and baseline['schema'] != current_schema:
+        print(f"The schema of {database} changed since the baseline was recorded")
+
+    results = {}
+    records = []
+    for name, (query, params) in PROFILE_QUERIES.get(database, {}).items():
+        result = profile_query(graph, query, params, runs)
+        results[name] = result
+        record = {'query': name, **result}
+        previous = (baseline or {}).get('queries', {}).get(name)
+        if previous is not None:
+            record['baseline_db_hits'] = previous['db_hits']
+            record['baseline_time'] = previous['time']
+            record['regression'] = result['db_hits'] > previous['db_hits'] * (1 + tolerance) \
+                or (result['time'] > previous['time'] * (1 + tolerance) and result['time'] - previous['time'] > min_time) \
+                or result['rows'] != previous['rows']
+        records.append(record)
+
+    if update or baseline is None:
+        baselines[database] = {'schema': current_schema, 'recorded': time.strftime('%Y-%m-%d %H:%M:%S'),
+                               'queries': results}
+        os.makedirs(os.path.dirname(baseline_file) or '.', exist_ok=True)
+        atomic_write(baseline_file, lambda f: json.dump(baselines, f, indent=2), mode='w')
+    df = pd.DataFrame(records).set_index('query') if len(records) > 0 else pd.DataFrame()
+    if 'regression' in df and df['regression'].any():
+        print(f"Regressions in {database}: {', '.join(df.index[df['regression'].fillna(False).astype(bool)])}")
+    return df
@@ -0,0 +1,261 @@
+import os
+import re
+import json
+import pickle
+import fnmatch
+from bisect import bisect_left
+import numpy as np
+import pandas as pd
+
+from scripts.utils import create_cached_corpus, load_corpus_index, article_texts, atomic_write
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+class InvertedIndex:
+    """
+    Positional inverted index over a corpus, which answers term, phrase and wildcard queries
+    without scanning the texts. Documents are added in segments, each holding the postings
+    (document, position) of its documents sorted by token id, so that documents can be added
+    without rebuilding the index. Removed documents are only marked as deleted until compact()
+    is called.
+    """
+    def __init__(self):
+        self.vocab = {}
+        self.lower_vocab = {}
+        self.sorted_vocab = None
+        self.segments = []
+        self.doc_keys = []
+        self.doc_index = {}
+        self.doc_years = []
+        self.doc_lengths = []
+        self.deleted = set()
+
+    def __len__(self):
+        return len(self.doc_keys) - len(self.deleted)
+
+    def _token_id(self, token):
+        token_id = self.vocab.get(token)
+        if token_id is None:
+            token_id = self.vocab[token] = len(self.vocab)
+            self.lower_vocab.setdefault(token.lower(), []).append(token_id)
+            self.sorted_vocab = None
+        return token_id
+
+    def add_documents(self, keys, texts, years):
+        """
+        Add the texts with the given unique keys and publication years as a new segment
+        """
+        token_ids = []
+        docs = []
+        for key, text, year in zip(keys, texts, years):
+            if key in self.doc_index:
+                raise ValueError(f"Document '{key}' is already in the index")
+            doc_id = len(self.doc_keys)
+            ids = np.array([self._token_id(t) for t in TOKEN_PATTERN.findall(text)], dtype=np.int32)
+            self.doc_index[key] = doc_id
+            self.doc_keys.append(key)
+            self.doc_years.append(year)
+            self.doc_lengths.append(len(ids))
+            token_ids.append(ids)
+            docs.append(np.full(len(ids), doc_id, dtype=np.int32))
+        if len(token_ids) == 0:
+            return
+        self.segments.append(self._build_segment(
+            np.concatenate(token_ids),
+            np.concatenate(docs),
+            np.concatenate([np.arange(len(ids), dtype=np.int32) for ids in token_ids])))
+
+    def _build_segment(self, token_ids, docs, positions):
+        # sort the postings by token, keeping the document and position order of each token
+        order = np.argsort(token_ids, kind='stable')
+        counts = np.bincount(token_ids, minlength=len(self.vocab))
+        offsets = np.zeros(len(self.vocab) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return {'offsets': offsets, 'docs': docs[order], 'positions': positions[order]}
+
+    def remove_documents(self, keys):
+        for key in keys:
+            self.deleted.add(self.doc_index[key])
+
+    def compact(self):
+        """
+        Merge all segments into one and drop deleted documents, which renumbers the documents
+        """
+        token_ids = []
+        docs = []
+        positions = []
+        for segment in self.segments:
+            offsets = segment['offsets']
+            token_ids.append(np.repeat(np.arange(len(offsets) - 1, dtype=np.int32), np.diff(offsets)))
+            docs.append(segment['docs'])
+            positions.append(segment['positions'])
+        doc_map = np.full(len(self.doc_keys), -1, dtype=np.int32)
+        doc_keys, doc_years, doc_lengths = [], [], []
+        for doc_id, key in enumerate(self.doc_keys):
+            if doc_id not in self.deleted:
+                doc_map[doc_id] = len(doc_keys)
+                doc_keys.append(key)
+                doc_years.append(self.doc_years[doc_id])
+                doc_lengths.append(self.doc_lengths[doc_id])
+        self.doc_keys, self.doc_years, self.doc_lengths = doc_keys, doc_years, doc_lengths
+        self.doc_index = {key: doc_id for doc_id, key in enumerate(doc_keys)}
+        self.deleted = set()
+        if len(token_ids) == 0:
+            self.segments = []
+            return
+        token_ids = np.concatenate(token_ids)
+        docs = doc_map[np.concatenate(docs)]
+        positions = np.concatenate(positions)
+        keep = docs >= 0
+        self.segments = [self._build_segment(token_ids[keep], docs[keep], positions[keep])]
+
+    def _postings(self, token_ids):
+        # return the documents and positions of the given tokens, across all segments
+        docs = []
+        positions = []
+        for segment in self.segments:
+            offsets = segment['offsets']
+            for token_id in token_ids:
+                if token_id < len(offsets) - 1:
+                    start, end = offsets[token_id], offsets[token_id + 1]
+                    docs.append(segment['docs'][start:end])
+                    positions.append(segment['positions'][start:end])
+        if len(docs) == 0:
+            return np.array([], dtype=np.int32), np.array([], dtype=np.int32)
+        return np.concatenate(docs), np.concatenate(positions)
+
+    def _token_ids(self, token, case_sensitive=True):
+        if case_sensitive:
+            return [self.vocab[token]] if token in self.vocab else []
+        return self.lower_vocab.get(token.lower(), [])
+
+    def _doc_counts(self, docs):
+        counts = np.bincount(docs, minlength=len(self.doc_keys))
+        if len(self.deleted) > 0:
+            counts[list(self.deleted)] = 0
+        return counts
+
+    def term_counts(self, term, case_sensitive=True) -> np.ndarray:
+        """
+        Return the number of occurrences of the token in each document
+        """
+        docs, _ = self._postings(self._token_ids(term, case_sensitive))
+        return self._doc_counts(docs)
+
+    def phrase_counts(self, phrase, case_sensitive=True) -> np.ndarray:
+        """
+        Return the number of occurrences of the sequence of tokens in each document
+        """
+        tokens = TOKEN_PATTERN.findall(phrase)
+        keys = None
+        for i, token in enumerate(tokens):
+            docs, positions = self._postings(self._token_ids(token, case_sensitive))
+            valid = positions >= i
+            # encode document and start position of the phrase as one integer
+            token_keys = (docs[valid].astype(np.int64) << 32) | (positions[valid] - i).astype(np.int64)
+            keys = token_keys if keys is None else np.intersect1d(keys, token_keys, assume_unique=True)
+            if len(keys) == 0:
+                break
+        if keys is None:
+            keys = np.array([], dtype=np.int64)
+        return self._doc_counts((keys >> 32).astype(np.int64))
+
+    def wildcard_counts(self, pattern, case_sensitive=True) -> np.ndarray:
+        """
+        Return the number of tokens matching the wildcard pattern (with '*' and '?') in each document
+        """
+        if not case_sensitive:
+            pattern = pattern.lower()
+        vocab = self.vocab if case_sensitive else self.lower_vocab
+        if pattern.endswith('*') and not any(c in pattern[:-1] for c in '*?['):
+            # prefix query, find the matching tokens by binary search in the sorted vocabulary
+            prefix = pattern[:-1]
+            if self.sorted_vocab is None:
+                self.sorted_vocab = (sorted(self.vocab), sorted(self.lower_vocab))
+            sorted_vocab = self.sorted_vocab[0 if case_sensitive else 1]
+            i = bisect_left(sorted_vocab, prefix)
+            tokens = []
+            while i < len(sorted_vocab) and sorted_vocab[i].startswith(prefix):
+                tokens.append(sorted_vocab[i])
+                i += 1
+        else:
+            regex = re.compile(fnmatch.translate(pattern))
+            tokens = [token for token in vocab if regex.match(token)]
+        token_ids = []
+        for token in tokens:
+            token_ids.extend(self._token_ids(token, case_sensitive))
+        docs, _ = self._postings(token_ids)
+        return self._doc_counts(docs)
+
+    def doc_counts(self, query, case_sensitive=True) -> np.ndarray:
+        """
+        Return the number of matches of the query in each document. Queries consisting of words are
+        answered as terms or phrases, words containing '*' or '?' as wildcard patterns.
+        """
+        if re.fullmatch(r'\w+', query):
+            return self.term_counts(query, case_sensitive)
+        if re.fullmatch(r'[\w\s]+', query):
+            return self.phrase_counts(query, case_sensitive)
+        if re.fullmatch(r'[\w*?]+', query):
+            return self.wildcard_counts(query, case_sensitive)
+        raise ValueError(f"'{query}' is not a term, phrase or wildcard query")
+
+    def counts_by_year(self, query, case_sensitive=True, articles_df=None) -> pd.Series:
+        """
+        Return the number of matches of the query per year, see doc_counts(). Other queries are
+        treated as regular expressions, which are answered by scanning the texts in articles_df.
+        """
+        if re.fullmatch(r'[\w\s*?]+', query):
+            counts = self.doc_counts(query, case_sensitive)
+            return pd.Series(counts, index=self.doc_years, name=query).groupby(level=0).sum().sort_index()
+        if articles_df is None:
+            raise ValueError(f"'{query}' can only be answered by scanning the texts, articles_df is required")
+        pattern = re.compile(query, 0 if case_sensitive else re.IGNORECASE)
+        counts = [len(pattern.findall(text)) for text in article_texts(articles_df)]
+        return pd.Series(counts, index=articles_df['year'].values, name=query, dtype=np.int64) \
+            .groupby(level=0).sum().sort_index()
+
+    def year_totals(self) -> pd.Series:
+        """
+        Return the number of tokens per year
+        """
+        lengths = np.array(self.doc_lengths, dtype=np.int64)
+        if len(self.deleted) > 0:
+            lengths[list(self.deleted)] = 0
+        return pd.Series(lengths, index=self.doc_years, name='total_token_count').groupby(level=0).sum().sort_index()
+
+
+def create_cached_index(cache_id: str, max_segments=8) -> InvertedIndex:
+    """
+    Return the inverted index of the corpus create_cached_corpus(cache_id), cached in
+    cache/{cache_id}.index.pkl. Documents are identified by their file and its content hash, so that
+    only new or changed documents are indexed when the corpus has changed.
+    """
+    create_cached_corpus(cache_id, lazy_text=True)
+    articles_df, texts = load_corpus_index(cache_id)
+    with open(f'cache/{cache_id}.manifest.json') as f:
+        manifest = json.load(f)
+    index_file_path = f'cache/{cache_id}.index.pkl'
+    if os.path.exists(index_file_path):
+        with open(index_file_path, mode='rb') as f:
+            index = pickle.load(f)
+    else:
+        index = InvertedIndex()
+
+    keys = {(file, manifest[file]['sha1']): (text_id, year)
+            for file, text_id, year in zip(articles_df['file'], articles_df['text_id'], articles_df['year'])}
+    removed = [key for key, doc_id in index.doc_index.items() if key not in keys and doc_id not in index.deleted]
+    added = [key for key in keys if key not in index.doc_index or index.doc_index[key] in index.deleted]
+    if len(removed) == 0 and len(added) == 0:
+        return index
+
+    index.remove_documents(removed)
+    if any(key in index.doc_index for key in added):
+        # a deleted document was added again, its postings need to be dropped before re-indexing
+        index.compact()
+    index.add_documents(added, [texts[keys[key][0]] for key in added], [keys[key][1] for key in added])
+    if len(index.segments) > max_segments:
+        index.compact()
+    atomic_write(index_file_path, lambda f: pickle.dump(index, f))
+    return index
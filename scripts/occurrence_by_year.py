@@ -2,27 +2,50 @@
 
 import re
 import numpy as np
+import pandas as pd
 import matplotlib.ticker as ticker
 import matplotlib.pyplot as plt
 
-from utils import truncate
+from utils import truncate, article_texts, text_keys, LRUCache
+
+# cache of the number of matches of a regex in a text, keyed by regex and text_keys()
+_occurrence_cache = LRUCache(1_000_000)
+
+def count_occurrences(articles_df, regex_list) -> pd.DataFrame:
+    """
+    Return a matrix (documents x regexes) with the number of matches of each regex in each text,
+    with the smallest unsigned integer dtype that fits. articles_df is not modified. Counts are cached,
+    so that only texts that have not been searched for a regex before are decoded and scanned.
+    """
+    keys = text_keys(articles_df)
+    cached = {regex: [_occurrence_cache.get((regex, key)) for key in keys] for regex in regex_list}
+    missing = sorted({i for values in cached.values() for i, count in enumerate(values) if count is None})
+    texts = article_texts(articles_df)
+    missing_texts = pd.Series([texts[i] for i in missing], index=missing, dtype=object)
+    counts = {}
+    for regex in regex_list:
+        values = np.array([-1 if count is None else count for count in cached[regex]], dtype=np.int64)
+        todo = np.flatnonzero(values < 0)
+        if len(todo) > 0:
+            values[todo] = missing_texts.loc[todo].str.count(regex).to_numpy(dtype=np.int64)
+            for i in todo:
+                _occurrence_cache[(regex, keys[i])] = int(values[i])
+        counts[regex] = pd.to_numeric(pd.Series(values, index=articles_df.index), downcast='unsigned')
+    return pd.DataFrame(counts, index=articles_df.index)
 
 def plot_occurrences(articles_df, regex_list, first_year=None, last_year=None):
     # Find the occurrences of each regex in the text files
-    occurrences = {}
-    for regex in regex_list:
-        regex_occurrences = []
-        for text in articles_df['text']:
-            regex_occurrences.append(len(re.findall(regex, text)))
-        articles_df[regex] = regex_occurrences
+    counts = count_occurrences(articles_df, regex_list)
 
     # Group the occurrences by year
-    grouped_occurrences = articles_df.groupby('year').agg({regex: sum for regex in regex_list})
+    grouped_occurrences = counts.groupby(articles_df['year']).sum()
 
     # Find the article with the most occurrences of the first regex in each year
     first_regex = regex_list[0]
-    top_articles = articles_df.loc[articles_df.groupby('year')[first_regex].idxmax()]
-    top_articles = top_articles.loc[top_articles[first_regex] > 0]
+    top_index = counts[first_regex].groupby(articles_df['year']).idxmax()
+    top_articles = articles_df.loc[top_index, ['author', 'year', 'title']]
+    top_articles['count'] = counts.loc[top_index, first_regex].values
+    top_articles = top_articles.loc[top_articles['count'] > 0]
     if first_year is not None:
         top_articles = top_articles.loc[top_articles['year'] >= first_year]
     if last_year is not None:
@@ -55,7 +78,7 @@ def plot_occurrences(articles_df, regex_list, first_year=None, last_year=None):
 
     # Create the box with the numbered list of top articles
     top_articles_list = [
-        f'{i+1}. {row["author"]} ({row["year"]}) {truncate(row["title"], 30)} [{row[first_regex]}]'
+        f'{i+1}. {row["author"]} ({row["year"]}) {truncate(row["title"], 30)} [{row["count"]}]'
         for i, row in top_articles.iterrows()
     ]
     ax2.axis('off')
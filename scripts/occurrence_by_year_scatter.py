@@ -2,23 +2,71 @@ from matplotlib import pyplot as plt
 from matplotlib.ticker import MultipleLocator
 import re
 import pandas as pd
+import numpy as np
+
+from scripts.utils import article_texts, text_keys, LRUCache
+
+# cache of the number of words per document, keyed by text_keys()
+_word_counts = LRUCache(100_000)
+
+def word_count(text, key):
+    count = _word_counts.get(key)
+    if count is None:
+        count = _word_counts[key] = len(text.split())
+    return count
+
+def compile_counter(regex):
+    """
+    Return a function that counts the (non-overlapping) matches of the regex in a text. Literal search
+    terms are counted with str.count, which gives the same result as re.findall but is much faster
+    """
+    if not any(c in regex for c in '.^$*+?{}[]\\|()'):
+        return lambda text: text.count(regex)
+    pattern = re.compile(regex)
+    return lambda text: len(pattern.findall(text))
+
+def count_terms(texts, regex_list, word_count_keys=None) -> np.ndarray:
+    """
+    Return a matrix (documents x regexes) with the number of matches of each regex in each text,
+    scanning each text once for all regexes. With `word_count_keys`, the keys of the texts returned
+    by text_keys(), the last column is the number of words, which is cached by these keys.
+    """
+    counters = [compile_counter(regex) for regex in regex_list]
+    columns = len(counters) + (word_count_keys is not None)
+    counts = np.zeros((len(texts), columns), dtype=np.int64)
+    for i, text in enumerate(texts):
+        row = [counter(text) for counter in counters]
+        if word_count_keys is not None:
+            row.append(word_count(text, word_count_keys[i]))
+        counts[i] = row
+    return counts
 
 def prepare_data(articles_df, regex_list, column='text'):
-    data = []
     regex_list.reverse()
+    terms = []
+    regexes = []
     for regex in regex_list:
         if type(regex) is tuple:
             term, regex = regex
         else:
             term = regex
-        for year, year_df in articles_df.groupby('year'):
-            total_word_count = year_df[column].apply(lambda x: len(x.split())).sum()
-            count = year_df[column].apply(lambda x: len(re.findall(regex, x))).sum()
+        terms.append(term)
+        regexes.append(regex)
+
+    # count words and matches of all regexes with a single pass over the documents
+    counts = pd.DataFrame(count_terms(article_texts(articles_df, column), regexes,
+                                      word_count_keys=text_keys(articles_df, column)),
+                          index=articles_df.index, columns=list(range(len(regexes))) + ['total_word_count'])
+    grouped = counts.groupby(articles_df['year']).sum()
+
+    data = []
+    for idx, (term, regex) in enumerate(zip(terms, regexes)):
+        for year, row in zip(grouped.index, grouped.itertuples(index=False)):
             data.append({'year': year,
                          'term': term,
-                         'count': count,
+                         'count': row[idx],
                          'regex': regex,
-                         'total_word_count': total_word_count})
+                         'total_word_count': row[-1]})
 
     aggregated = pd.DataFrame(data)
     return aggregated
@@ -1,10 +1,17 @@
-import json, re
+import json, os, shutil
+from functools import lru_cache
+from jinja2 import Environment, FileSystemLoader
+import pyvis
 from py2neo import Graph, Path, Node, Relationship, walk
 from pyvis.network import Network
 from IPython.display import display, HTML, Image
-from typing import Union
+from typing import Union, Callable
 from textwrap import shorten
-import subprocess
+from scripts.screenshot import save_screenshots
+from scripts.force_layout import force_atlas2_layout
+import numpy as np
+import math
+from concurrent.futures import ProcessPoolExecutor
 
 
 def strip_property_prefix(input_dict, prefix):
@@ -17,34 +24,82 @@ def strip_property_prefix(input_dict, prefix):
         output_dict[new_key] = value
     return output_dict
 
+class IndexedList(list):
+    """
+    A list with constant-time membership tests, which replaces the list of node ids of a pyvis
+    Network, as pyvis checks it for every node and edge that is added
+    """
+    def __init__(self, items=()):
+        super().__init__(items)
+        self.index = set(self)
+
+    def append(self, item):
+        super().append(item)
+        self.index.add(item)
+
+    def __contains__(self, item):
+        return item in self.index
+
+
+def get_edge_index(net: Network) -> dict:
+    # return a dict of the edges in the network by their (from, to) pair, creating it on first use
+    if not hasattr(net, 'edge_index'):
+        net.node_ids = IndexedList(net.node_ids)
+        net.edge_index = {(e['from'], e['to']): e for e in net.edges}
+    return net.edge_index
+
+
+def shorten_label(label: str) -> str:
+    return shorten(label, width=50, placeholder="...").replace(':', ':\n')
+
+
 def py2neo_to_pyvis(net: Network,
                     obj: Union[Path, Node, Relationship],
                     auto_rel_label=False,
                     edge_default_width=3,
-                    font_default_size=20):
+                    font_default_size=20,
+                    style: dict = None):
+    """
+    Add a node, relationship or path to the network. The pyvis options are taken from the properties of the
+    node or relationship, where properties with a "vis_" prefix override the others, and from `style`, which
+    overrides both. If the node or relationship is already in the network, only the style is applied.
+    """
+    style = {key: value for key, value in (style or {}).items() if value is not None}
+    if 'label' in style and type(obj) is Node:
+        style['label'] = shorten_label(str(style['label']))
     if type(obj) is Path:
         for o in walk(obj):
             py2neo_to_pyvis(net, o)
     elif type(obj) is Node:
+        get_edge_index(net)
+        # the first node with the same identity wins
+        if obj.identity in net.node_ids:
+            net.get_node(obj.identity).update(style)
+            return
         p = strip_property_prefix(dict(obj), "vis_")
         label = p.get('label') or p.get('display_name') or p.get('title') or p.get('name') or p.get('id') or ''
-        p['label'] = shorten(label, width=50, placeholder="...").replace(':', ':\n')
+        p['label'] = shorten_label(label)
         if 'group' not in p or p['group'] is None:
             p['group'] = str(obj.labels)
         if 'font' not in p or p['font'] is None:
             p['font'] = {'size': font_default_size}
+        p.update(style)
         net.add_node(obj.identity, **p)
+        # pyvis ignores the color of nodes with a group
+        net.get_node(obj.identity).update(style)
     elif issubclass(type(obj), Relationship):
         start_node = obj.start_node
         end_node = obj.end_node
         # check that no relations already exists (doesn't allow multiple relationships)
-        for e in net.edges:
-            if e['from'] == start_node.identity and e['to'] == end_node.identity:
-                return
+        edge_index = get_edge_index(net)
+        if (start_node.identity, end_node.identity) in edge_index:
+            edge_index[(start_node.identity, end_node.identity)].update(style)
+            return
         py2neo_to_pyvis(net, start_node)
         py2neo_to_pyvis(net, end_node)
         neo4j_label = type(obj).__name__
         p = strip_property_prefix(dict(obj), "vis_")
+        p.update(style)
         if 'title' not in p or p['title'] is None:
             p['title'] = neo4j_label
         if 'label' not in p or p['label'] is None:
@@ -54,6 +109,103 @@ def py2neo_to_pyvis(net: Network,
         if 'width' not in p or p['width'] is None:
             p['width'] = edge_default_width
         net.add_edge(start_node.identity, end_node.identity, **p)
+        edge_index[(start_node.identity, end_node.identity)] = net.edges[-1]
+
+
+def new_network(height: str = "300px", seed: int = None) -> Network:
+    net = Network(height, notebook=True, cdn_resources='in_line', directed=True)
+    net.force_atlas_2based(overlap=0.7, damping=1)
+    if seed is not None:
+        options = json.loads(net.options.to_json())
+        options['layout'] = {"randomSeed": seed, "improvedLayout": True}
+        options = json.dumps(options)
+        net.set_options(options)
+    return net
+
+
+def get_network_options(net: Network) -> dict:
+    return net.options if isinstance(net.options, dict) else json.loads(net.options.to_json())
+
+
+def set_network_options(net: Network, options: dict):
+    # pyvis replaces its options object with a dict on the first call of set_options()
+    if isinstance(net.options, dict):
+        net.options = options
+    else:
+        net.set_options(json.dumps(options))
+
+
+def physics_enabled(net: Network) -> bool:
+    return get_network_options(net).get('physics', {}).get('enabled', True)
+
+
+def apply_layout(net: Network,
+                 seed: int = None,
+                 positions: dict = None,
+                 iterations: int = 300,
+                 scale: float = 5,
+                 **kwargs) -> dict:
+    """
+    Compute the positions of the nodes with force_atlas2_layout() and store them in the network, disabling
+    the physics simulation in the browser. Edges are weighted by the logarithm of their value. `positions`
+    (node id -> (x, y)), e.g. from the network of the previous period, are used as starting points.
+    Returns the positions of all nodes. Further keyword arguments are passed to force_atlas2_layout().
+    The repulsion between nodes is exact for networks of up to 1000 nodes (`exact_limit`), whose cost grows
+    quadratically with the number of nodes; larger networks use a Barnes-Hut approximation, which grows
+    with n log n.
+    """
+    node_ids = [node['id'] for node in net.nodes]
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    edges = []
+    weights = []
+    for edge in net.edges:
+        if edge['from'] in index and edge['to'] in index and edge['from'] != edge['to']:
+            edges.append((index[edge['from']], index[edge['to']]))
+            value = edge.get('value')
+            weights.append(1 + math.log(value) if isinstance(value, (int, float)) and value >= 1 else 1)
+    initial = None
+    if positions:
+        initial = np.full((len(node_ids), 2), np.nan)
+        for node_id, xy in positions.items():
+            if node_id in index:
+                initial[index[node_id]] = np.array(xy) / scale
+    coordinates = force_atlas2_layout(len(node_ids), edges, weights, positions=initial, seed=seed,
+                                      iterations=iterations, **kwargs) * scale
+    for node, (x, y) in zip(net.nodes, coordinates):
+        node['x'] = float(x)
+        node['y'] = float(y)
+    options = get_network_options(net)
+    options.setdefault('physics', {})['enabled'] = False
+    set_network_options(net, options)
+    return {node_id: (float(x), float(y)) for node_id, (x, y) in zip(node_ids, coordinates)}
+
+
+# suffix of the query columns with style maps, e.g. "RETURN a, {value: count} AS a_style" styles the nodes in column a
+STYLE_SUFFIX = "_style"
+
+
+def row_styles(row: dict, style: Callable = None) -> dict:
+    """
+    Return the styles of the nodes and relationships in a row of a query result, by column. Styles are read
+    from "<column>_style" map columns and from the result of the `style(column, obj, row)` callback, which
+    overrides them.
+    """
+    styles = {}
+    for key, obj in row.items():
+        if key.endswith(STYLE_SUFFIX) and key[:-len(STYLE_SUFFIX)] in row:
+            continue
+        obj_style = dict(row.get(key + STYLE_SUFFIX) or {})
+        if style is not None:
+            obj_style.update(style(key, obj, row) or {})
+        styles[key] = obj_style
+    return styles
+
+
+def add_rows_to_network(net: Network, data: list, auto_rel_label=False, style: Callable = None) -> Network:
+    for row in data:
+        for key, obj_style in row_styles(row, style).items():
+            py2neo_to_pyvis(net, row[key], auto_rel_label=auto_rel_label, style=obj_style)
+    return net
 
 
 def create_or_update_network(graph: Graph,
@@ -62,58 +214,74 @@ def create_or_update_network(graph: Graph,
                              auto_rel_label=False,
                              net: Network = None,
                              seed: int = None,
+                             style: Callable = None,
                              **kwargs) -> Network:
+    """
+    Run the query and add the nodes and relationships of the result to the network (a new one by default).
+    Instead of writing "vis_" properties to the database, the query can return style maps for the objects in
+    a column, in a column with the same name and a "_style" suffix, or a `style(column, obj, row)` callback
+    can return them, see row_styles().
+    """
     data = graph.run(query, **kwargs).data()
     if net is None:
-        net = Network(height, notebook=True, cdn_resources='in_line', directed=True)
-        net.force_atlas_2based(overlap=0.7, damping=1)
-        if seed is not None:
-            options = json.loads(net.options.to_json())
-            options['layout'] = {"randomSeed": seed, "improvedLayout": True}
-            options = json.dumps(options)
-            net.set_options(options)
-    for row in data:
-        for obj in row.values():
-            py2neo_to_pyvis(net, obj, auto_rel_label=auto_rel_label)
-    return net
+        net = new_network(height, seed)
+    return add_rows_to_network(net, data, auto_rel_label=auto_rel_label, style=style)
 
 
 def generate_script(min_edge_value: int = 10):
     return """
         const storageId = "pyvis-network-slider-value"
-        let edgeCache = []; // this array will store the removed edges
         const slider = document.getElementById("edgeValueSlider");
         
-        // update the network according to the slider value
+        // edges with a value, sorted by descending value, so that the edges shown for a threshold are
+        // always the first ones. Edges without a value are never removed.
+        const sortedEdges = edges.get({filter: edge => typeof edge.value === "number"})
+            .sort((a, b) => b.value - a.value);
+        let shownCount = sortedEdges.length;
+        
+        // return the number of edges with a value greater than or equal to the threshold (binary search)
+        const countEdges = threshold => {
+          let low = 0, high = sortedEdges.length;
+          while (low < high) {
+            const mid = (low + high) >>> 1;
+            if (sortedEdges[mid].value >= threshold) low = mid + 1; else high = mid;
+          }
+          return low;
+        };
+        
+        // update the network according to the slider value, adding or removing only the edges
+        // between the old and the new threshold in one batch
         const updateNetwork = value => {
-          // Check each edge
-          edges.forEach(edge => {
-            // if edge value is less than slider value, move it to the cache
-            if (edge.value < value) {
-              edgeCache.push(edge); // add to cache
-              edges.remove(edge.id); // remove from DataSet
-            }
-          });
-          // Check each cached edge
-          for (let i = edgeCache.length - 1; i >= 0; i--) {
-            let cachedEdge = edgeCache[i];
-            // If cached edge value is more than or equal to slider value, re-add it to the network
-            if (cachedEdge.value >= value) {
-              edges.add(cachedEdge); // add back to DataSet
-              edgeCache.splice(i, 1); // remove from cache
-            }
+          const count = countEdges(Number(value));
+          if (count < shownCount) {
+            edges.remove(sortedEdges.slice(count, shownCount).map(edge => edge.id));
+          } else if (count > shownCount) {
+            edges.add(sortedEdges.slice(shownCount, count));
           }
+          shownCount = count;
           window.localStorage.setItem(storageId, value);
         };
         
+        // update the network at most once per frame while the slider is dragged
+        let pendingValue = null;
+        const scheduleUpdate = value => {
+          if (pendingValue === null) {
+            window.requestAnimationFrame(() => {
+              updateNetwork(pendingValue);
+              pendingValue = null;
+            });
+          }
+          pendingValue = value;
+        };
+        
         // update the display with the value of the slider
         const displaySliderValue = value => {
             document.getElementById("sliderValue").innerText = value
         }
         
         // determine highest and lowest number of citation 
-        let min = Math.min(...edges.get().map(edge => edge.value));
-        let max = Math.max(...edges.get().map(edge => edge.value));
+        let min = sortedEdges.length > 0 ? sortedEdges[sortedEdges.length - 1].value : 0;
+        let max = sortedEdges.length > 0 ? sortedEdges[0].value : 0;
         
         // dynamically determine the slider options (=ticks)
         let steps = [1, 2, 5, 10, 25, 50, 100];
@@ -126,8 +294,11 @@ def generate_script(min_edge_value: int = 10):
         }
         
         // configure the slider
-        slider.addEventListener('change', e => updateNetwork(e.target.value));
-        slider.addEventListener('input', e => displaySliderValue(e.target.value))
+        slider.addEventListener('change', e => scheduleUpdate(e.target.value));
+        slider.addEventListener('input', e => {
+            displaySliderValue(e.target.value);
+            scheduleUpdate(e.target.value);
+        });
         slider.min = min;
         slider.max = max;
         const datalist = document.getElementById('steplist');
@@ -140,76 +311,99 @@ def generate_script(min_edge_value: int = 10):
         // the default slider value comes either from the "min_edge_value" query param, 
         // the local storage (to persist across pages), or a value passed to the script
         const defaultValue = parseInt(new URLSearchParams(document.location.search).get('min_edge_value')) || 
-                parseInt(window.localStorage.getItem(storageId)) || $min_edge_value;
+                parseInt(window.localStorage.getItem(storageId)) || $min_edge_value || min;
         const value = Math.min(defaultValue, max);
         slider.value = value;
         updateNetwork(value);
         displaySliderValue(value)
-    """.replace("$min_edge_value", str(min_edge_value))
+    """.replace("$min_edge_value", json.dumps(min_edge_value))
 
 
-def draw_network(net: Network,
+# the vis-network files shipped with pyvis, which are inlined into the pages or written to a shared folder
+VIS_ASSETS = {
+    'js': os.path.join(os.path.dirname(pyvis.__file__), 'templates', 'lib', 'vis-9.1.2', 'vis-network.min.js'),
+    'css': os.path.join(os.path.dirname(pyvis.__file__), 'templates', 'lib', 'vis-9.1.2', 'vis-network.css'),
+}
+
+template_env = Environment(loader=FileSystemLoader(os.path.join(os.path.dirname(__file__), '..', 'lib')))
+
+
+@lru_cache(maxsize=None)
+def read_vis_assets() -> dict:
+    assets = {}
+    for key, file_path in VIS_ASSETS.items():
+        with open(file_path, encoding="utf-8") as f:
+            assets[key] = f.read()
+    return assets
+
+
+def write_vis_assets(directory: str) -> str:
+    """
+    Copy the vis-network library files into `directory` (unless they are already there), so that
+    pages rendered with network_html(assets_url=...) can share them. Returns the directory.
+    """
+    os.makedirs(directory, exist_ok=True)
+    for file_path in VIS_ASSETS.values():
+        target = os.path.join(directory, os.path.basename(file_path))
+        if not os.path.exists(target) or os.path.getsize(target) != os.path.getsize(file_path):
+            shutil.copyfile(file_path, target)
+    return directory
+
+
+def network_html(net: Network,
                  title: str = None,
                  caption: str = None,
-                 file: str = None,
-                 screenshot = False,
-                 url: str = None,
                  prev_url: str = None,
                  next_url: str = None,
                  show_nav_bar: bool = True,
                  show_slider: bool = False,
                  min_edge_value: int = None,
                  show_physics_toggle: bool = False,
-                 link_only: bool = False):
-    html = net.generate_html()
-    # remove nonsense in the generated html
-    html = re.sub(r'<center>.*?<h1></h1>.*?</center>', '', html, flags=re.M | re.S)
-    # optional: add title
-    if title is not None:
-        html = html.replace("<head>", f'<head><title>{title}</title>')
-        html = html.replace("<body>", f'<body><h1 style="text-align:center">{title}</h1>')
-    # optional: caption
-    if caption is not None:
-        html = html.replace("</body>", f'\n<div style="text-align:center; text-wrap: balance">{caption}</div>\n</body>')
-    # navigation bar
-    if show_nav_bar:
-        nav_bar = '<div style="text-align:center">'
-        if caption:
-            nav_bar = "<hr/>" + nav_bar
-        # optional: back and forward links
-        if prev_url or next_url:
-            if prev_url:
-                nav_bar += f'<a href="{prev_url}">Previous</a>'
-                nav_bar += '&nbsp;| '
-            if next_url:
-                nav_bar += f'<a href="{next_url}">Next</a>'
-                nav_bar += '&nbsp;| '
-        if show_slider is not None:
-            nav_bar += '<datalist id="steplist"></datalist>'
-            nav_bar += 'Minimum citations:&nbsp;<span id="sliderValue" style="width: 30px;display: inline-block;"></span>&nbsp;'
-            nav_bar += '<input style="width:200px" type="range" class="slider" id="edgeValueSlider" list="steplist"></input>'
-            nav_bar += '&nbsp;| '
-        # optional: show checkbox to toggle physics
-        if show_physics_toggle == True:
-            nav_bar += 'Enable physics:&nbsp;<input type="checkbox" checked onchange="network.setOptions({ physics: this.checked })">'
-        nav_bar += '</div>'
-        if show_slider is not None:
-            nav_bar += f'\n<script>{generate_script(min_edge_value)}</script>'
-        html = html.replace("</body>", f'\n{nav_bar}\n</body>')
-
-    # optional: save to file
-    if file is not None:
-        if file.endswith(".html"):
-            with open(file, mode="w", encoding="utf-8") as f:
-                f.write(html)
-            if screenshot:
-                result = subprocess.run(['python', 'scripts/save-screenshot.py', file, "10"], stdout=subprocess.PIPE,
-                                        stderr=subprocess.PIPE)
-                error = result.stderr.decode('utf-8')
-                if error != "":
-                    raise RuntimeError(error)
-        else:
-            raise RuntimeError("Unsupported file extension")
+                 assets_url: str = None) -> str:
+    """
+    Render the network as a html page from lib/network.html.tmpl. By default, the vis-network library
+    is inlined, so that the page is self-contained. With `assets_url`, the page references the library
+    files at this (relative) url instead, see write_vis_assets().
+    """
+    height = net.height
+    if isinstance(height, int) or str(height).isdigit():
+        height = f"{height}px"
+    template = template_env.get_template('network.html.tmpl')
+    return template.render(title=title,
+                           caption=caption,
+                           assets_url=assets_url,
+                           assets=read_vis_assets() if assets_url is None else None,
+                           width=net.width,
+                           height=height,
+                           bgcolor=net.bgcolor,
+                           nodes=net.nodes,
+                           edges=net.edges,
+                           options=json.dumps(get_network_options(net)),
+                           show_nav_bar=show_nav_bar,
+                           prev_url=prev_url,
+                           next_url=next_url,
+                           show_slider=show_slider,
+                           slider_script=generate_script(min_edge_value),
+                           show_physics_toggle=show_physics_toggle,
+                           physics_enabled=physics_enabled(net))
+
+
+def save_network_html(html: str, file: str, screenshot=False):
+    if file.endswith(".html"):
+        with open(file, mode="w", encoding="utf-8") as f:
+            f.write(html)
+        if screenshot:
+            save_screenshots([file])
+    else:
+        raise RuntimeError("Unsupported file extension")
+
+
+def displays_html(screenshot, url: str = None, link_only: bool = False) -> bool:
+    # whether display_network() shows the html itself rather than a link or a screenshot
+    return not (link_only and url) and not screenshot
+
+
+def display_network(html: str, file: str = None, screenshot=False, url: str = None, link_only: bool = False):
     # optional: return a link only
     if link_only and url:
         display(HTML(f'Open graph at <a href="{url}" target="_blank">{url}.</a>'))
@@ -219,6 +413,40 @@ def draw_network(net: Network,
         display(HTML(html))
 
 
+def draw_network(net: Network,
+                 title: str = None,
+                 caption: str = None,
+                 file: str = None,
+                 screenshot = False,
+                 url: str = None,
+                 prev_url: str = None,
+                 next_url: str = None,
+                 show_nav_bar: bool = True,
+                 show_slider: bool = False,
+                 min_edge_value: int = None,
+                 show_physics_toggle: bool = False,
+                 link_only: bool = False,
+                 shared_assets: bool = False):
+    html_kwargs = dict(title=title, caption=caption, prev_url=prev_url, next_url=next_url,
+                       show_nav_bar=show_nav_bar, show_slider=show_slider, min_edge_value=min_edge_value,
+                       show_physics_toggle=show_physics_toggle)
+    html = None
+    # optional: save to file, with the vis-network library in the "assets" folder next to it
+    if file is not None:
+        assets_url = None
+        if shared_assets:
+            write_vis_assets(os.path.join(os.path.dirname(file), 'assets'))
+            assets_url = 'assets'
+        file_html = network_html(net, assets_url=assets_url, **html_kwargs)
+        save_network_html(file_html, file, screenshot)
+        if not shared_assets:
+            html = file_html
+    if html is None and displays_html(screenshot and file, url, link_only):
+        # the notebook cannot load the shared assets, so the displayed page is self-contained
+        html = network_html(net, **html_kwargs)
+    display_network(html, file=file, screenshot=screenshot, url=url, link_only=link_only)
+
+
 # convenience method, deprecated, use create_or_update_network() and draw_network() instead
 def draw(graph: Graph,
          query: str,
@@ -237,6 +465,84 @@ def draw(graph: Graph,
     return draw_network(net, file=file, link_only=link_only, title=title)
 
 
+def year_windows(start_year: int, end_year: int, num_ranges: int = None, window_size: int = 10, step: int = None):
+    """
+    Return a list of (first year, last year) tuples of `window_size` years, starting every `step` years
+    (by default, directly after the previous window). Windows with a step smaller than their size overlap.
+    """
+    step = step or window_size
+    windows = []
+    window_start = start_year
+    while window_start <= end_year and (num_ranges is None or len(windows) < num_ranges):
+        windows.append((window_start, min(window_start + window_size - 1, end_year)))
+        window_start += step
+    return windows
+
+
+def window_rows(data: list, year_start: int, year_end: int, year_key: str = 'year', style: Callable = None) -> list:
+    """
+    Select the rows of a query result which have a `year_key` value in the given window. Relationships
+    between the same nodes are merged into one, summing up their numeric 'value' properties and style
+    values (and updating labels which show the value). The year column itself is dropped, the styles of
+    the objects (see row_styles()) are returned in "node_style" and "rel_style" columns.
+    """
+    nodes = {}
+    relationships = {}
+    for row in data:
+        year = row.get(year_key)
+        if year is None or year < year_start or year > year_end:
+            continue
+        for key, obj_style in row_styles(row, style).items():
+            obj = row[key]
+            if key == year_key:
+                continue
+            if issubclass(type(obj), Relationship):
+                rel_key = (obj.start_node.identity, obj.end_node.identity, type(obj).__name__)
+                if rel_key not in relationships:
+                    relationships[rel_key] = (obj, dict(obj), obj_style)
+                    continue
+                _, props, rel_style = relationships[rel_key]
+                merge_values(props, obj, ['value', 'vis_value'], ['label', 'vis_label'])
+                merge_values(rel_style, obj_style, ['value'], ['label'])
+            elif obj is not None:
+                node_key = getattr(obj, 'identity', id(obj))
+                if node_key in nodes:
+                    nodes[node_key][1].update(obj_style)
+                else:
+                    nodes[node_key] = (obj, obj_style)
+    rows = [{'node': node, 'node_style': node_style} for node, node_style in nodes.values()]
+    for rel, props, rel_style in relationships.values():
+        rows.append({'rel': type(rel)(rel.start_node, rel.end_node, **props), 'rel_style': rel_style})
+    return rows
+
+
+def merge_values(props: dict, other: dict, value_keys: list, label_keys: list):
+    # add the numeric values of `other` to `props`, updating the labels which show the value
+    for value_key in value_keys:
+        if isinstance(other.get(value_key), (int, float)) and isinstance(props.get(value_key), (int, float)):
+            value = props[value_key] + other[value_key]
+            for label_key in label_keys:
+                if props.get(label_key) == str(props[value_key]):
+                    props[label_key] = str(value)
+            props[value_key] = value
+
+
+def _render_window(height, options, nodes, edges, file, html_kwargs):
+    # rebuild a network from its nodes and edges, render it and save the html file (used in worker processes)
+    net = Network(height, notebook=True, cdn_resources='in_line', directed=True)
+    net.set_options(options)
+    get_edge_index(net)
+    for node in nodes:
+        node = dict(node)
+        net.add_node(node.pop('id'), **node)
+    for edge in edges:
+        edge = dict(edge)
+        net.add_edge(edge.pop('from'), edge.pop('to'), **edge)
+    html = network_html(net, **html_kwargs)
+    save_network_html(html, file)
+    return html
+
+
 def create_timeseries(graph: Graph,
                       query: str,
                       file_id: str,
@@ -252,27 +558,77 @@ def create_timeseries(graph: Graph,
                       show_physics_toggle: bool = True,
                       start_year=1974,
                       end_year=2023,
-                      num_ranges=5):
-    for i in range(num_ranges):
-        decade_start = start_year + (i * 10)
-        decade_end = decade_start + 9
-        if decade_end > end_year:
-            decade_end = end_year
-        net = create_or_update_network(graph, query, height="600", seed=seed,
-                                       year_start=decade_start, year_end=decade_end)
-        file = f"{file_id}-{decade_start}-{decade_end}.html"
+                      num_ranges=5,
+                      window_size=10,
+                      step=None,
+                      single_query=False,
+                      workers: int = None,
+                      layout=False,
+                      shared_assets=False,
+                      style: Callable = None):
+    """
+    Create a network for each window of years and save it as a html page, with links between the pages.
+    By default, the query is run for each window with the $year_start and $year_end parameters. With
+    `single_query`, it is run once for the whole range and must return a 'year' column, its rows are
+    split into the windows with window_rows(). `query` can also be a function which returns the rows of
+    a window, given the first and last year (e.g. CitationGraph.co_citation_rows). With more than one worker, the pages are rendered in
+    parallel processes. With `layout`, the node positions are computed with apply_layout(), starting
+    from the positions of the nodes in the previous windows, so that they stay in place. With
+    `shared_assets`, the pages load the vis-network library from an "assets" folder next to them.
+    Nodes and relationships are styled as in create_or_update_network().
+    """
+    windows = year_windows(start_year, end_year, num_ranges, window_size, step)
+    if single_query and not callable(query):
+        data = graph.run(query, year_start=windows[0][0], year_end=windows[-1][1]).data()
+    executor = ProcessPoolExecutor(max_workers=workers) if workers is not None and workers > 1 else None
+    pages = []
+    positions = {}
+    assets_url = None
+    if shared_assets:
+        write_vis_assets(os.path.join(os.path.dirname(file_prefix), 'assets'))
+        assets_url = 'assets'
+    for i, (year_start, year_end) in enumerate(windows):
+        if callable(query):
+            net = add_rows_to_network(new_network("600", seed), query(year_start, year_end), style=style)
+        elif single_query:
+            net = add_rows_to_network(new_network("600", seed), window_rows(data, year_start, year_end, style=style))
+        else:
+            net = create_or_update_network(graph, query, height="600", seed=seed, style=style,
+                                           year_start=year_start, year_end=year_end)
+        if layout:
+            positions.update(apply_layout(net, seed=seed, positions=positions))
+        file = f"{file_id}-{year_start}-{year_end}.html"
         prev_url = next_url = graph_url = None
         if url is not None:
             graph_url = f"{url}/{file}"
-            prev_url = f"{file_id}-{decade_start - 10}-{decade_start - 1}.html" if i > 0 else None
-            next_url = f"{file_id}-{decade_end + 1}-{decade_end + 10}.html" if i < (num_ranges - 1) else None
-        draw_network(net, title=f"{title}, {decade_start} - {decade_end}", caption=caption,
-                     prev_url=prev_url, next_url=next_url, screenshot=screenshot, link_only=not screenshot,
-                     file=f"{file_prefix}{file}", url=graph_url, min_edge_value=min_edge_value, show_nav_bar=show_nav_bar,
-                     show_slider=show_slider, show_physics_toggle=show_physics_toggle)
+            prev_url = f"{file_id}-{windows[i - 1][0]}-{windows[i - 1][1]}.html" if i > 0 else None
+            next_url = f"{file_id}-{windows[i + 1][0]}-{windows[i + 1][1]}.html" if i < len(windows) - 1 else None
+        html_kwargs = dict(title=f"{title}, {year_start} - {year_end}", caption=caption,
+                           prev_url=prev_url, next_url=next_url, min_edge_value=min_edge_value,
+                           show_nav_bar=show_nav_bar, show_slider=show_slider,
+                           show_physics_toggle=show_physics_toggle)
+        if executor is None:
+            html = network_html(net, assets_url=assets_url, **html_kwargs)
+            save_network_html(html, f"{file_prefix}{file}")
+        else:
+            html = executor.submit(_render_window, net.height, json.dumps(get_network_options(net)), net.nodes, net.edges,
+                                   f"{file_prefix}{file}", dict(html_kwargs, assets_url=assets_url))
+        display_html = None
+        if shared_assets and displays_html(screenshot, graph_url, not screenshot):
+            # the notebook cannot load the shared assets, so the displayed page is self-contained
+            display_html = network_html(net, **html_kwargs)
+        pages.append((html, display_html, f"{file_prefix}{file}", graph_url))
+    if executor is not None:
+        pages = [(html.result(), display_html, file, graph_url) for html, display_html, file, graph_url in pages]
+        executor.shutdown()
+    # take the screenshots of all pages at once
+    if screenshot:
+        save_screenshots([file for _, _, file, _ in pages])
+    for html, display_html, file, graph_url in pages:
+        display_network(display_html or html, file=file, screenshot=screenshot, url=graph_url, link_only=not screenshot)
 
 def cleanup(graph: Graph):
-    # remove styling properties from nodes and relationships
+    # remove "vis_" styling properties from nodes and relationships, not needed with style maps (see row_styles())
     graph.run("""
         MATCH (n) WHERE any(key IN keys(n) WHERE key STARTS WITH 'vis_')
         WITH n, [key IN keys(n) WHERE key STARTS WITH 'vis_'] AS keys
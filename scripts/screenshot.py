@@ -0,0 +1,125 @@
+import os
+import atexit
+import asyncio
+import threading
+from urllib.parse import urljoin
+from urllib.request import pathname2url
+
+# resolves when the vis.js network has stabilized (or the timeout has passed) and has been drawn again
+WAIT_FOR_NETWORK = """
+async (timeout) => {
+    const physics = network.physics;
+    if (physics && physics.physicsEnabled && !physics.stabilized) {
+        await new Promise(resolve => {
+            network.once('stabilized', resolve);
+            setTimeout(resolve, timeout);
+        });
+    }
+    network.stopSimulation();
+    await new Promise(resolve => {
+        network.once('afterDrawing', resolve);
+        network.redraw();
+        setTimeout(resolve, 1000);
+    });
+}
+"""
+
+
+class ScreenshotService:
+    """
+    Renders screenshots of html files with networks generated by pyvis, using a single headless
+    Chromium which is kept alive between calls. The browser is driven by an event loop in a
+    background thread, so the service can also be used from Jupyter notebooks, which run their own loop.
+    """
+    def __init__(self, device_scale_factor=5, max_pages=4):
+        self.device_scale_factor = device_scale_factor
+        self.max_pages = max_pages
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.playwright = None
+        self.browser = None
+        # concurrent screenshots wait for the browser which is launched first, instead of each launching one
+        self.browser_lock = asyncio.Lock()
+
+    def _run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    async def _get_browser(self):
+        if self.browser is None:
+            async with self.browser_lock:
+                if self.browser is None:
+                    # playwright is only needed for screenshots, see https://playwright.dev/python/docs/intro
+                    from playwright.async_api import async_playwright
+                    playwright = await async_playwright().start()
+                    try:
+                        self.browser = await playwright.chromium.launch()
+                    except Exception:
+                        await playwright.stop()
+                        raise
+                    self.playwright = playwright
+        return self.browser
+
+    async def _screenshot(self, file_path, semaphore, timeout):
+        async with semaphore:
+            browser = await self._get_browser()
+            context = await browser.new_context(device_scale_factor=self.device_scale_factor)
+            try:
+                page = await context.new_page()
+                await page.goto(urljoin('file:', pathname2url(os.path.abspath(file_path))))
+                await page.wait_for_function("typeof network !== 'undefined'", timeout=timeout * 1000)
+                await page.evaluate(WAIT_FOR_NETWORK, timeout * 1000)
+
+                # Set the viewport to cover the entire page content
+                dimensions = await page.evaluate('''() => {
+                    return {
+                        width: document.documentElement.scrollWidth,
+                        height: document.documentElement.scrollHeight,
+                    }
+                }''')
+                await page.set_viewport_size(dimensions)
+
+                # Take a screenshot of the entire page
+                img_filename = file_path.replace(".html", ".png")
+                await page.screenshot(path=img_filename, full_page=True, scale="device")
+                return img_filename
+            finally:
+                await context.close()
+
+    async def _screenshot_many(self, file_paths, timeout):
+        semaphore = asyncio.Semaphore(self.max_pages)
+        return await asyncio.gather(*[self._screenshot(file_path, semaphore, timeout) for file_path in file_paths])
+
+    def screenshot_many(self, file_paths, timeout=30):
+        """
+        Save a png next to each of the html files, rendering up to `max_pages` files at the same time.
+        Waits up to `timeout` seconds for each network to stabilize. Returns the paths of the images.
+        """
+        return self._run(self._screenshot_many(list(file_paths), timeout))
+
+    async def _close(self):
+        async with self.browser_lock:
+            if self.browser is not None:
+                await self.browser.close()
+                await self.playwright.stop()
+                self.browser = self.playwright = None
+
+    def close(self):
+        if self.loop.is_running():
+            self._run(self._close())
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+_service = None
+
+
+def get_screenshot_service() -> ScreenshotService:
+    global _service
+    if _service is None:
+        _service = ScreenshotService()
+        atexit.register(_service.close)
+    return _service
+
+
+def save_screenshots(file_paths, timeout=30):
+    return get_screenshot_service().screenshot_many(file_paths, timeout=timeout)
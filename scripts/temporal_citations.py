@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from scripts.citation_graph import CitationGraph
+
+
+class YearlyCitations:
+    """
+    Per-year partial aggregates of a CitationGraph: the citations of each author and venue, and the
+    co-citation counts of author pairs, by the year of the citing work. As these are additive, the values
+    of any window of years are sums of the partials: citation counts are answered from cumulative sums,
+    co-citation matrices of consecutive windows by adding the years entering the window and subtracting
+    those leaving it.
+    """
+    def __init__(self, citation_graph: CitationGraph):
+        self.citation_graph = citation_graph
+        years = citation_graph.work_years[~np.isnan(citation_graph.work_years)]
+        self.first_year = int(years.min()) if len(years) > 0 else 0
+        self.years = np.arange(self.first_year, int(years.max()) + 1 if len(years) > 0 else 0)
+        author_counts = [citation_graph.citation_counts(year, year) for year in self.years]
+        venue_counts = [citation_graph.venue_citation_counts(year, year) for year in self.years]
+        # cumulative sums with a leading row of zeros, so that a window is the difference of two rows
+        self.author_totals = self._cumulative(author_counts, len(citation_graph.author_props))
+        self.venue_totals = self._cumulative(venue_counts, len(citation_graph.venue_props))
+        self.co_citation_partials = [sparse.triu(citation_graph.co_citation(year, year), k=1).tocsr()
+                                     for year in self.years]
+        self._window = None
+
+    @staticmethod
+    def _cumulative(counts, size):
+        totals = np.zeros((len(counts) + 1, size), dtype=np.int64)
+        if len(counts) > 0:
+            np.cumsum(np.vstack(counts), axis=0, out=totals[1:])
+        return totals
+
+    def _index_range(self, year_start, year_end):
+        # the range of the partials of the given years, clipped to the years with data
+        start = min(max(year_start - self.first_year, 0), len(self.years))
+        end = min(max(year_end - self.first_year + 1, start), len(self.years))
+        return start, end
+
+    def citation_counts(self, year_start, year_end) -> np.ndarray:
+        """
+        Return the number of citations of each author by works published in the given years
+        """
+        start, end = self._index_range(year_start, year_end)
+        return self.author_totals[end] - self.author_totals[start]
+
+    def venue_citation_counts(self, year_start, year_end) -> np.ndarray:
+        start, end = self._index_range(year_start, year_end)
+        return self.venue_totals[end] - self.venue_totals[start]
+
+    def co_citation(self, year_start, year_end) -> sparse.csr_matrix:
+        """
+        Return the co-citation counts of author pairs (upper triangle) in works published in the given years.
+        The last window is kept, so that the next one only needs the partials of the years which differ.
+        """
+        start, end = self._index_range(year_start, year_end)
+        size = len(self.citation_graph.author_props)
+        if self._window is not None:
+            last_start, last_end, matrix = self._window
+            changed = abs(start - last_start) + abs(end - last_end)
+        if self._window is None or changed >= end - start:
+            matrix = sparse.csr_matrix((size, size), dtype=np.int64)
+            for partial in self.co_citation_partials[start:end]:
+                matrix = matrix + partial
+        else:
+            for i in range(last_end, end):
+                matrix = matrix + self.co_citation_partials[i]
+            for i in range(start, last_start):
+                matrix = matrix + self.co_citation_partials[i]
+            for i in range(last_start, start):
+                matrix = matrix - self.co_citation_partials[i]
+            for i in range(end, last_end):
+                matrix = matrix - self.co_citation_partials[i]
+            matrix.eliminate_zeros()
+        self._window = (start, end, matrix)
+        return matrix
+
+    def co_citation_rows(self, year_start, year_end, min_value=1, limit: int = None, node_values=False) -> list:
+        """
+        Same as CitationGraph.co_citation_rows(), e.g. as `query` for create_timeseries() with a step of one year
+        """
+        values = self.citation_counts(year_start, year_end) if node_values else None
+        return self.citation_graph.pair_rows(self.co_citation(year_start, year_end), "IS_COCITED_WITH",
+                                             min_value, limit, values)
+
+    def rolling(self, window_size=10, step=1, start_year=None, end_year=None):
+        """
+        Yield (first year, last year, co-citation matrix) for windows of `window_size` years every `step` years
+        """
+        start_year = self.first_year if start_year is None else start_year
+        end_year = int(self.years[-1]) if end_year is None and len(self.years) > 0 else end_year
+        year = start_year
+        while year + window_size - 1 <= end_year:
+            yield year, year + window_size - 1, self.co_citation(year, year + window_size - 1)
+            year += step
+
+    def _trends(self, totals, names, window_size, top):
+        # the windowed sums ending in each year, as a DataFrame (year x name), for the `top` names overall
+        windows = totals[window_size:] - totals[:-window_size] if len(totals) > window_size else \
+            np.zeros((0, totals.shape[1]), dtype=np.int64)
+        columns = np.argsort(-totals[-1], kind='stable')[:top]
+        return pd.DataFrame(windows[:, columns], index=self.years[window_size - 1:],
+                            columns=[names[i] for i in columns])
+
+    def author_trends(self, window_size=5, top=20) -> pd.DataFrame:
+        """
+        Return the citations of the `top` most-cited authors in rolling windows of `window_size` years,
+        indexed by the last year of the window
+        """
+        names = [props.get('display_name') for props in self.citation_graph.author_props]
+        return self._trends(self.author_totals, names, window_size, top)
+
+    def venue_trends(self, window_size=5, top=20) -> pd.DataFrame:
+        names = [props.get('name') for props in self.citation_graph.venue_props]
+        return self._trends(self.venue_totals, names, window_size, top)
@@ -0,0 +1,225 @@
+import os
+import re
+import pickle
+import hashlib
+from string import punctuation
+from datetime import date
+from concurrent.futures import ProcessPoolExecutor
+from tqdm.notebook import tqdm
+
+from scripts.utils import DOICache, update_corpus_manifest, atomic_write
+
+JLS_NOISE_WORDS = {'jstor', 'conditions', 'terms', 'use', 'content', 'de', 'la', 'cit', 'yves', 'pm', 'tue', 'mon',
+                   'wed', 'thu', 'fri', 'downloaded', 'jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep',
+                   'oct', 'nov', 'dec', 'vsl', 'pl', 'weyl', 'viscusi', 'lea', 'vm'}
+
+ZFRSOZ_NOISE_WORDS = {"rechtssoziologie", "dr", "prof", "lucius", "universitt", "recht", "rechts", "fakultt", "vgl", "ff",
+                      "mehr", "hrsg", "wurde", "nicht", "kol", "et", "wurden", "de", "la", "eg", "universität",
+                      "halle", "uni", "bitte", "autoren", "autorinnen", "sollten", "brunschwig",
+                      "emas", "nr", "xi", "kapitel", "rezensionen", "buch", "ute", "scherzberg", "stefan"
+                      "lucius", "stuttgart", "bora", "workshop", "law", "legal", "recht", "fakultät",
+                      "universität", "universities", "university", "bochum", "berlin", "zeitschrift",
+                      "barch", "sapmo", "machura", "isbn", "isbn", "doi", "doi", "https", "www", "fish", "tel"
+                      "bielefeld", "telefon", "sei", "stefan", "manuskripte", "etwa", "erhard",
+                      "max", "treiber", "tabelle", "kamel", "maiwald", "gephart", "gumbel", "blankenburg",
+                      "teubner", "weber", "webers", "luhmann", "kaupen", "siehe", "new", "bverfge", "englischer",
+                      "gegebenenfalls", "hesc", "recht", "droit", "zeitschrift", "zeitschriften",
+                      "anonymisierten", "rechtschreibung", "einreichung", "one", "heft", "armin", "email", "tel",
+                      "graphiken", "tabellen", "beachten", "schen", "rice", "jutta", "limbach", "toa",
+                      "hirsch", "ehrlich", "raiser", "struck", "johannes", "niklas", "schon", "wolfgang"
+                      "jansen", "lehrstuhl", "wolfgang", "see", "literaturverzeichnis", "immer", "dabei"
+                      "dorothea", "jansen", "höland", "eigentlich", "foucault", "konstanze", "plett", "bielefeld"
+                      "preis", "sektion", "wissenschaftlicher", "mitarbeiter", "institut", "zumbansen",
+                      "natürlich", "schelsky"}
+
+# texts containing one of these are author guidelines or calls for papers rather than articles
+ZFRSOZ_SKIP_MARKERS = ("Hinweise für Autor", "Richtlinien für Autor", "Postfach", "Silbentrennung")
+
+
+class TokenFilter:
+    """
+    Removes stopwords and unwanted tokens from whitespace-tokenized texts. Tokens are optionally stripped
+    of surrounding punctuation, and dropped if they are shorter than `min_length`, match `reject_pattern`
+    (searched anywhere in the token), are stopwords (case-insensitive) or, with `substring_min_length`,
+    contain a stopword longer than that. The decision is made once per distinct token and then looked up.
+    """
+    def __init__(self, stopwords, strip_punctuation=False, min_length=0, reject_pattern=None,
+                 substring_min_length: int = None):
+        self.stopwords = frozenset(stopwords)
+        self.strip_punctuation = strip_punctuation
+        self.min_length = min_length
+        self.reject_pattern = reject_pattern
+        self.substring_min_length = substring_min_length
+        self._reject = re.compile(reject_pattern) if reject_pattern is not None else None
+        long_stopwords = sorted(w for w in self.stopwords
+                                if substring_min_length is not None and len(w) > substring_min_length)
+        self._substrings = re.compile('|'.join(map(re.escape, long_stopwords))) if long_stopwords else None
+        self._tokens = {}
+
+    def __getstate__(self):
+        # the token decisions are not shipped to worker processes
+        return {**self.__dict__, '_tokens': {}}
+
+    def fingerprint(self) -> str:
+        config = (sorted(self.stopwords), self.strip_punctuation, self.min_length, self.reject_pattern,
+                  self.substring_min_length)
+        return hashlib.sha1(repr(config).encode('utf-8')).hexdigest()
+
+    def filter_token(self, token):
+        """
+        Return the token as it is kept in the text, or None if it is removed
+        """
+        if self.strip_punctuation:
+            token = token.strip(punctuation).strip()
+        if len(token) < self.min_length:
+            return None
+        if self._reject is not None and self._reject.search(token):
+            return None
+        lower = token.lower()
+        if lower in self.stopwords or (self._substrings is not None and self._substrings.search(lower)):
+            return None
+        return token
+
+    def __call__(self, text: str) -> str:
+        tokens = text.split()
+        decisions = self._tokens
+        for token in set(tokens).difference(decisions):
+            decisions[token] = self.filter_token(token)
+        return ' '.join(kept for kept in map(decisions.__getitem__, tokens) if kept)
+
+
+def jls_token_filter() -> TokenFilter:
+    # tokens starting with a digit and English stopwords
+    from nltk.corpus import stopwords
+    return TokenFilter(set(stopwords.words('english')) | JLS_NOISE_WORDS, reject_pattern=r'^\d')
+
+
+def zfrsoz_token_filter() -> TokenFilter:
+    # tokens of up to two characters or containing punctuation or digits, and German and English stopwords,
+    # also as part of a longer word to remove plurals or misspelled words
+    from nltk.corpus import stopwords
+    return TokenFilter(set(stopwords.words('german') + stopwords.words('english')) | ZFRSOZ_NOISE_WORDS,
+                       strip_punctuation=True, min_length=3, reject_pattern=f'[{re.escape(punctuation)}\\d]',
+                       substring_min_length=5)
+
+
+def doi_from_corpus_filename(filename):
+    return filename.strip(".txt").replace("_", "/")
+
+
+def jls_year_of(file_path='data/jls-doi-to-year.csv'):
+    """
+    Return a function mapping corpus file names to the publication year in the DOI list, also trying
+    the ".x" variant of the DOI
+    """
+    doi_cache = DOICache(file_path)
+
+    def year_of(filename):
+        doi = doi_from_corpus_filename(filename)
+        return doi_cache.get_year(doi) or doi_cache.get_year(f"{doi}.x")
+    return year_of
+
+
+def zfrsoz_year_of(filename):
+    # the file names contain the year after the first dash
+    return int(filename.split("-")[1])
+
+
+_worker_state = None
+
+
+def _init_worker(token_filter: TokenFilter, skip_markers):
+    global _worker_state
+    _worker_state = (token_filter, skip_markers)
+
+
+def _preprocess_file(file_path):
+    # returns the filtered text, None for skipped texts, or the exception if the file cannot be read
+    token_filter, skip_markers = _worker_state
+    try:
+        with open(file_path, "r", encoding="utf-8") as f:
+            text = f.read()
+    except Exception as e:
+        return e
+    if any(marker in text for marker in skip_markers):
+        return None
+    return token_filter(text)
+
+
+def preprocess_corpus(corpus_dir, token_filter: TokenFilter, year_of, cache_id: str, skip_markers=(),
+                      workers: int = None, cache_dir='cache'):
+    """
+    Filter the texts of the corpus for topic modelling and return the texts and their dates, the first
+    and last year, and the DOIs of the files without a year, as (articles, earliest_year, latest_year,
+    not_found, timestamps). `year_of(filename)` returns the year of a file or a false value. Texts
+    containing one of the `skip_markers` are left out.
+
+    The filtered texts are cached by content hash in cache_dir/<cache_id>-preprocessed.pkl, so that only
+    new or changed files are processed again, in a pool of `workers` processes if greater than 1. The cache
+    is discarded if the filter or the skip markers change.
+    """
+    filenames = sorted(f for f in os.listdir(corpus_dir) if f.endswith(".txt") and not f.startswith("."))
+    if len(filenames) == 0:
+        raise RuntimeError(f"Directory {corpus_dir} has no text files")
+    cache_file = os.path.join(cache_dir, f'{cache_id}-preprocessed.pkl')
+    fingerprint = (token_filter.fingerprint(), tuple(skip_markers))
+    cache = None
+    if os.path.exists(cache_file):
+        with open(cache_file, 'rb') as f:
+            cache = pickle.load(f)
+    if cache is None or cache['fingerprint'] != fingerprint:
+        cache = {'fingerprint': fingerprint, 'manifest': {}, 'texts': {}}
+    manifest, _, _ = update_corpus_manifest(corpus_dir, cache['manifest'])
+    texts = cache['texts']
+    todo = [filename for filename in filenames if manifest[filename]['sha1'] not in texts]
+
+    if len(todo) > 0:
+        file_paths = [os.path.join(corpus_dir, filename) for filename in todo]
+        executor = None
+        if workers is not None and workers > 1:
+            executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                           initargs=(token_filter, skip_markers))
+            results = executor.map(_preprocess_file, file_paths,
+                                   chunksize=max(1, len(file_paths) // (workers * 4)))
+        else:
+            _init_worker(token_filter, skip_markers)
+            results = map(_preprocess_file, file_paths)
+        try:
+            for filename, file_path, text in tqdm(zip(todo, file_paths, results), total=len(todo),
+                                                  desc="Preprocessing articles"):
+                if isinstance(text, Exception):
+                    # unreadable files are tried again next time
+                    print(f"Could not read {file_path}: {str(text)}")
+                    continue
+                texts[manifest[filename]['sha1']] = text
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    # keep only the texts of the current files
+    hashes = {entry['sha1'] for entry in manifest.values()}
+    if len(todo) > 0 or cache['manifest'] != manifest or len(texts) != len(hashes & texts.keys()):
+        cache = {'fingerprint': fingerprint, 'manifest': manifest,
+                 'texts': {sha1: text for sha1, text in texts.items() if sha1 in hashes}}
+        os.makedirs(cache_dir, exist_ok=True)
+        atomic_write(cache_file, lambda f: pickle.dump(cache, f))
+
+    articles = []
+    timestamps = []
+    not_found = []
+    for filename in filenames:
+        sha1 = manifest[filename]['sha1']
+        if sha1 not in texts or texts[sha1] is None:
+            continue
+        year = year_of(filename)
+        # only use articles for which we have a year
+        if year:
+            timestamps.append(date(int(year), 1, 1))
+            articles.append(texts[sha1])
+        else:
+            not_found.append(doi_from_corpus_filename(filename))
+    if len(timestamps) == 0:
+        raise RuntimeError("No timestamps found, check your data.")
+    earliest_year = min(timestamps).strftime('%Y')
+    latest_year = max(timestamps).strftime('%Y')
+    return articles, earliest_year, latest_year, not_found, timestamps
@@ -1,35 +1,235 @@
 import pandas as pd
+import numpy as np
 from tqdm.notebook import tqdm
 import json
 import requests
+from requests.adapters import HTTPAdapter
 import re
 import csv
-from py2neo import Graph
+from py2neo import Graph, Node, Relationship, Path, walk
+from py2neo.cypher import Record
 import os
+import shutil
 import pickle
 from IPython.display import display, HTML
 import time
+import threading
+import sqlite3
+import zlib
+import hashlib
+import mmap
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 from dotenv import load_dotenv
 load_dotenv()
 
-def get_graph(name):
-    return Graph(os.getenv('NEO4J_URL'), name=name)
+def get_graph(name, cache=False):
+    """
+    Return the py2neo Graph of the database with the given name, or with `cache`, a CachedGraph
+    which caches the results of read queries on disk
+    """
+    graph = Graph(os.getenv('NEO4J_URL'), name=name)
+    return CachedGraph(graph) if cache else graph
+
+# string literals in cypher queries, which are kept as they are when normalizing the whitespace
+CYPHER_STRING_PATTERN = re.compile(r"""('(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*"|`[^`]*`)""")
+# clauses and procedures which write to the database, queries containing them are never cached
+CYPHER_WRITE_PATTERN = re.compile(
+    r'(?<![.\w])(CREATE|MERGE|SET|DELETE|REMOVE|DROP|FOREACH|LOAD\s+CSV)\b|'
+    r'\bapoc\.(create\.(?!v)|refactor\.|periodic\.|merge\.|nodes\.delete|atomic\.)', re.IGNORECASE)
+
+def normalize_query(query):
+    # collapse whitespace outside of string literals
+    parts = CYPHER_STRING_PATTERN.split(query.strip())
+    return ''.join(part if i % 2 else re.sub(r'\s+', ' ', part) for i, part in enumerate(parts))
+
+def is_write_query(query):
+    # ignore string literals and comments
+    parts = CYPHER_STRING_PATTERN.split(query)
+    return any(CYPHER_WRITE_PATTERN.search(re.sub(r'//[^\n]*', '', part)) for part in parts[::2])
+
+def graph_fingerprint(graph: Graph):
+    """
+    Return a value which changes when the database changes: the id of the last committed transaction,
+    or if it isn't available (the JMX procedure is not supported by every Neo4j edition), the number of
+    nodes and relationships, which only changes with additions and deletions
+    """
+    try:
+        tx_id = graph.run("""
+            CALL dbms.queryJmx('org.neo4j:*') YIELD name, attributes
+            WHERE name CONTAINS 'name=Transactions' AND name =~ ('.*database=' + $db + '(,.*)?')
+            RETURN attributes.LastCommittedTxId.value""", db=graph.name).evaluate()
+        if tx_id is not None:
+            return f'tx:{tx_id}'
+    except Exception:
+        pass
+    nodes = graph.run("MATCH (n) RETURN count(n)").evaluate()
+    relationships = graph.run("MATCH ()-[r]->() RETURN count(r)").evaluate()
+    return f'counts:{nodes}:{relationships}'
+
+def encode_value(value):
+    # replace py2neo nodes, relationships and paths by plain tuples, which can be pickled without the graph
+    if isinstance(value, Node):
+        return ('__node__', value.identity, sorted(value.labels), dict(value))
+    if isinstance(value, Relationship):
+        return ('__rel__', value.identity, type(value).__name__, encode_value(value.start_node),
+                encode_value(value.end_node), dict(value))
+    if isinstance(value, Path):
+        return ('__path__', [encode_value(entity) for entity in walk(value)])
+    if isinstance(value, list):
+        return [encode_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: encode_value(v) for k, v in value.items()}
+    return value
+
+def decode_value(value, entities: dict):
+    # the reverse of encode_value(), `entities` makes sure that each node or relationship is created only once
+    if isinstance(value, tuple) and len(value) > 0 and value[0] in ('__node__', '__rel__', '__path__'):
+        if value[0] == '__path__':
+            return Path(*[decode_value(v, entities) for v in value[1]])
+        key = (value[0], value[1])
+        if key not in entities:
+            if value[0] == '__node__':
+                entity = Node(*value[2], **value[3])
+            else:
+                start_node = decode_value(value[3], entities)
+                end_node = decode_value(value[4], entities)
+                entity = Relationship.type(value[2])(start_node, end_node, **value[5])
+            entity.identity = value[1]
+            entities[key] = entity
+        return entities[key]
+    if isinstance(value, list):
+        return [decode_value(v, entities) for v in value]
+    if isinstance(value, dict):
+        return {k: decode_value(v, entities) for k, v in value.items()}
+    return value
+
+def encode_column(values):
+    # store numeric columns as numpy arrays, everything else as a list of encoded values
+    if len(values) > 0 and all(type(v) is int for v in values):
+        return np.array(values, dtype=np.int64)
+    if len(values) > 0 and all(type(v) is float for v in values):
+        return np.array(values, dtype=np.float64)
+    return [encode_value(v) for v in values]
+
+class CachedCursor:
+    """
+    The result of a cached query, with the methods of a py2neo Cursor used in the notebooks
+    """
+    def __init__(self, columns: dict):
+        self.columns = columns
+
+    def keys(self):
+        return list(self.columns)
+
+    def __iter__(self):
+        keys = self.keys()
+        values = [v.tolist() if isinstance(v, np.ndarray) else v for v in self.columns.values()]
+        for row in zip(*values):
+            yield Record(keys, row)
+
+    def data(self):
+        values = [v.tolist() if isinstance(v, np.ndarray) else v for v in self.columns.values()]
+        return [dict(zip(self.columns, row)) for row in zip(*values)]
+
+    def evaluate(self, field=0):
+        column = list(self.columns.values())[field] if isinstance(field, int) else self.columns[field]
+        return column[0].item() if isinstance(column, np.ndarray) and len(column) > 0 else \
+            (column[0] if len(column) > 0 else None)
+
+    def to_data_frame(self, index=None, columns=None, dtype=None):
+        return pd.DataFrame(self.columns, index=index, columns=columns, dtype=dtype)
+
+class CachedGraph:
+    """
+    Wraps a py2neo Graph and caches the results of read queries in cache/cypher/{database}, keyed by
+    the normalized query, its parameters and the fingerprint of the database (see graph_fingerprint()).
+    Results are stored by column. Queries which write to the database are passed through. If the
+    fingerprint is the last transaction id, it changes with every committed change, so the cached results
+    are kept; if it is based on counts, which do not change when only properties are set, writes
+    invalidate the cache of the database. Other attributes are those of the wrapped graph.
+    """
+    def __init__(self, graph: Graph, cache_dir='cache/cypher'):
+        self.graph = graph
+        self.cache_dir = os.path.join(cache_dir, graph.name or 'default')
+        # whether the last fingerprint was a transaction id, unknown until the first read query
+        self.tx_fingerprint = None
+
+    def __getattr__(self, name):
+        return getattr(self.graph, name)
+
+    def _query_dir(self, query):
+        query_hash = hashlib.sha1(normalize_query(query).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, query_hash)
+
+    def run(self, cypher, parameters=None, **kwparameters):
+        if is_write_query(cypher):
+            if not self.tx_fingerprint:
+                self.invalidate()
+            return self.graph.run(cypher, parameters, **kwparameters)
+        params = dict(parameters or {}, **kwparameters)
+        params_hash = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        params_dir = os.path.join(self._query_dir(cypher), params_hash)
+        fingerprint = graph_fingerprint(self.graph)
+        self.tx_fingerprint = fingerprint.startswith('tx:')
+        fingerprint = hashlib.sha1(fingerprint.encode('utf-8')).hexdigest()
+        file_path = os.path.join(params_dir, fingerprint + '.pkl')
+        if os.path.exists(file_path):
+            with open(file_path, mode='rb') as f:
+                keys, columns = pickle.load(f)
+            entities = {}
+            return CachedCursor({k: c if isinstance(c, np.ndarray) else [decode_value(v, entities) for v in c]
+                                 for k, c in zip(keys, columns)})
+        cursor = self.graph.run(cypher, params)
+        keys = list(cursor.keys())
+        rows = [tuple(record) for record in cursor]
+        values = [[row[i] for row in rows] for i in range(len(keys))]
+        # results for an older state of the database are not needed anymore
+        if os.path.isdir(params_dir):
+            shutil.rmtree(params_dir)
+        os.makedirs(params_dir, exist_ok=True)
+        atomic_write(file_path, lambda f: pickle.dump((keys, [encode_column(v) for v in values]), f))
+        return CachedCursor(dict(zip(keys, values)))
+
+    def invalidate(self, query: str = None):
+        """
+        Remove the cached results of the query (with any parameters), or of all queries of the database
+        """
+        directory = self._query_dir(query) if query is not None else self.cache_dir
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
 
 def get_corpus_dir(name):
     return os.path.join(os.getenv('CORPUS_BASE_DIR'), name)
 
 class DOICache:
+    """
+    Maps DOIs to publication years, loaded from one or more CSV files with 'DOI' and 'year' columns
+    """
     def __init__(self, file_path):
         self.file_path = file_path
         self.cache = self.load_cache()
+        # complete DOIs keyed by the DOI without the ".x" suffix, for looking up incomplete DOIs
+        self.normalized = {}
+        for doi in self.cache:
+            key = self.normalize(doi)
+            if key not in self.normalized or key == doi:
+                self.normalized[key] = doi
+
+    @staticmethod
+    def normalize(doi):
+        return doi[:-len(".x")] if doi.endswith(".x") else doi
 
     def load_cache(self):
         cache = {}
-        with open(self.file_path, newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                cache[row['DOI']] = int(row['year'])
+        file_paths = [self.file_path] if isinstance(self.file_path, str) else self.file_path
+        for file_path in file_paths:
+            with open(file_path, newline='') as csvfile:
+                reader = csv.DictReader(csvfile)
+                for row in reader:
+                    cache[row['DOI']] = int(row['year'])
         return cache
 
     def get_year(self, DOI):
@@ -38,6 +238,25 @@ class DOICache:
     def get_dois(self):
         return self.cache.keys()
 
+    def resolve_prefix(self, doi):
+        """
+        Return the DOI in the cache which is equal to the given (possibly incomplete) DOI, or else which
+        only differs from it by a ".x" suffix, or None if there is none
+        """
+        if doi in self.cache:
+            return doi
+        return self.normalized.get(self.normalize(doi))
+
+    def get_year_many(self, dois) -> dict:
+        """
+        Return a dict mapping the given DOIs to the year of their complete version in the cache
+        """
+        years = {}
+        for doi in dois:
+            resolved = self.resolve_prefix(doi)
+            years[doi] = self.cache[resolved] if resolved is not None else None
+        return years
+
 
 def extract_year(metadata):
     if 'published-print' in metadata:
@@ -60,48 +279,243 @@ def extract_author(metadata):
     author = metadata.get('author', [])
     return author[0].get('family','') if len(author) > 0 else ''
 
+CROSSREF_API_URL = os.getenv("CROSSREF_API_URL", "https://api.crossref.org")
+
+_session = None
+
+def get_session(pool_size=10):
+    # a single pooled session, so that connections to the CrossRef API are reused
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        _session.mount('http://', adapter)
+        _session.mount('https://', adapter)
+    return _session
+
+class RateLimiter:
+    """
+    Spaces out calls from several threads so that at most `rate` calls per second are made
+    """
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self.next_call = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            delay = self.next_call - now
+            self.next_call = max(now, self.next_call) + self.interval
+        if delay > 0:
+            time.sleep(delay)
+
+def fetch_metadata(doi, session: requests.Session = None, rate_limiter: RateLimiter = None,
+                   timeout=10, retries=3, backoff=1):
+    """
+    Download the metadata of a DOI from CrossRef. If the DOI is not found, the ".x" variant is tried.
+    Returns a tuple of the DOI that was found and its metadata (or None)
+    """
+    session = session or get_session()
+    email = os.environ.get("CROSSREF_API_EMAIL")
+    for attempt in range(retries):
+        url = f'{CROSSREF_API_URL}/works/{doi}?mailto={email}'
+        if rate_limiter:
+            rate_limiter.wait()
+        try:
+            response = session.get(url, timeout=timeout)
+            if response.status_code == 429 or response.status_code >= 500:
+                raise requests.exceptions.RetryError(f"HTTP {response.status_code}")
+            return doi, response.json()['message']
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError,
+                requests.exceptions.RetryError):
+            if attempt == retries - 1:
+                print(f"Timeout error: could not retrieve data from {url}")
+                break
+            # exponential backoff
+            time.sleep(backoff * 2 ** attempt)
+        except (json.JSONDecodeError, ValueError, KeyError):
+            if doi.endswith(".x"):
+                break
+            # add ".x" and try again
+            doi += ".x"
+    return doi, None
+
+class JSONDirMetadataStore:
+    """
+    Legacy metadata store which keeps the metadata of each DOI in its own file `{cache_dir}/{doi}.json`.
+    Failed lookups are stored as null and are never treated as cached.
+    """
+    def __init__(self, cache_dir='cache'):
+        self.cache_dir = cache_dir
+
+    def get_many(self, dois) -> dict:
+        result = {}
+        for doi in dois:
+            cache_file = os.path.join(self.cache_dir, f'{doi}.json')
+            if os.path.exists(cache_file):
+                with open(cache_file, 'r') as f:
+                    metadata = json.load(f)
+                if metadata:
+                    result[doi] = metadata
+        return result
+
+    def put_many(self, items: dict):
+        for doi, metadata in items.items():
+            cache_file = os.path.join(self.cache_dir, f'{doi}.json')
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            with open(cache_file, 'w') as f:
+                json.dump(metadata, f)
+
+class SQLiteMetadataStore:
+    """
+    Metadata store which keeps the zlib-compressed CrossRef metadata of all DOIs in a single SQLite
+    database in WAL mode. Failed lookups are cached as well, but expire after `negative_ttl` seconds.
+    On first use, the metadata in the legacy JSON cache directory is imported.
+    """
+    def __init__(self, path='cache/metadata.sqlite', negative_ttl=7 * 24 * 3600, compress=True,
+                 migrate_from='cache'):
+        self.path = path
+        self.negative_ttl = negative_ttl
+        self.compress = compress
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS metadata (doi TEXT PRIMARY KEY, data BLOB, fetched REAL)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS info (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+        if migrate_from is not None:
+            self.migrate_json_dir(migrate_from)
+
+    def _encode(self, metadata):
+        if not metadata:
+            return None
+        data = json.dumps(metadata).encode('utf-8')
+        return zlib.compress(data) if self.compress else data
+
+    @staticmethod
+    def _decode(data):
+        # compressed and uncompressed entries can be mixed, zlib streams start with 0x78
+        if data[:1] == b'x':
+            data = zlib.decompress(data)
+        return json.loads(data)
+
+    def get_many(self, dois) -> dict:
+        """
+        Return a dict mapping the cached DOIs to their metadata, or to None if a lookup of the DOI
+        failed less than `negative_ttl` seconds ago. DOIs which need to be (re-)fetched are omitted.
+        """
+        dois = list(dict.fromkeys(dois))
+        result = {}
+        min_fetched = time.time() - self.negative_ttl
+        with self.lock:
+            for i in range(0, len(dois), 500):
+                chunk = dois[i:i + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = self.conn.execute(f"SELECT doi, data, fetched FROM metadata WHERE doi IN ({placeholders})", chunk)
+                for doi, data, fetched in rows:
+                    if data is not None:
+                        result[doi] = self._decode(data)
+                    elif fetched >= min_fetched:
+                        result[doi] = None
+        return result
+
+    def put_many(self, items: dict, fetched: float = None):
+        fetched = fetched or time.time()
+        with self.lock, self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO metadata (doi, data, fetched) VALUES (?, ?, ?)",
+                                  [(doi, self._encode(metadata), fetched) for doi, metadata in items.items()])
+
+    def migrate_json_dir(self, cache_dir):
+        """
+        One-time import of the `{doi}.json` files written by JSONDirMetadataStore
+        """
+        with self.lock:
+            done = self.conn.execute("SELECT value FROM info WHERE key = 'migrated'").fetchone()
+        if done is not None or not os.path.isdir(cache_dir):
+            return
+        items = {}
+        for root, _, files in os.walk(cache_dir):
+            for file in files:
+                if not file.endswith('.json'):
+                    continue
+                file_path = os.path.join(root, file)
+                doi = os.path.relpath(file_path, cache_dir)[:-len('.json')].replace(os.sep, '/')
+                if not doi.startswith('10.'):
+                    continue
+                with open(file_path, 'r') as f:
+                    items[doi] = json.load(f)
+        self.put_many(items)
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO info (key, value) VALUES ('migrated', ?)", (str(len(items)),))
+
+_metadata_store = None
+
+def get_metadata_store():
+    # the type of store can be configured with the METADATA_STORE environment variable ("sqlite" or "json")
+    global _metadata_store
+    if _metadata_store is None:
+        if os.getenv("METADATA_STORE", "sqlite") == "json":
+            _metadata_store = JSONDirMetadataStore()
+        else:
+            _metadata_store = SQLiteMetadataStore()
+    return _metadata_store
+
+def resolve_doi(doi, doi_cache: DOICache=None):
+    # in case doi is incomplete, find the complete version in the doi cache
+    if doi_cache:
+        return doi_cache.resolve_prefix(doi) or doi
+    return doi
+
 def get_metadata(doi, doi_cache: DOICache=None):
-    cache_file = f'cache/{doi}.json'
-    metadata = None
-    if os.path.exists(cache_file):
-        with open(cache_file, 'r') as f:
-            metadata = json.load(f)
-    if metadata is None or len(metadata) == 0:
-        # in case doi is incomplete, find the complete version in the doi cache
-        if doi_cache:
-            for d in doi_cache.get_dois():
-                if d[:len(doi)] == doi:
-                    doi = d
-                    break
-        email = os.environ.get("CROSSREF_API_EMAIL")
-
-        for attempt in range(3):  # Retry mechanism
-            url = f'https://api.crossref.org/works/{doi}?mailto={email}'
-            try:
-                response = requests.get(url, timeout=3)  # Timeout of 3 seconds
-                metadata = response.json()['message']
-                break  # Break out of the loop if the request is successful
-            except requests.exceptions.Timeout:
-                if attempt == 2:  # If this was the third attempt
-                    print(f"Timeout error: could not retrieve data from {url}")
-                    break
-                else:
-                    print(f"Attempt {attempt + 1} failed, retrying...")
-                    time.sleep(1)
-            except json.JSONDecodeError:
-                if doi.endswith(".x"):
-                    break
-                # add ".x" and try again
-                doi += ".x"
+    store = get_metadata_store()
+    cached = store.get_many([doi])
+    if doi in cached:
+        return cached[doi]
 
+    _, metadata = fetch_metadata(resolve_doi(doi, doi_cache))
     if metadata is None:
         print(f"CrossRef error: could not load metadata for {doi}")
 
-    os.makedirs(os.path.dirname(cache_file), exist_ok=True)
-    with open(cache_file, 'w') as f:
-        json.dump(metadata, f)
+    store.put_many({doi: metadata})
     return metadata
 
+def get_metadata_many(dois, doi_cache: DOICache=None, max_workers=8, rate=20, **kwargs) -> dict:
+    """
+    Return a dict mapping each of the given DOIs to its metadata. DOIs which are not in the cache
+    are downloaded concurrently through a pooled session, at most `rate` requests per second.
+    Additional keyword arguments are passed to fetch_metadata()
+    """
+    store = get_metadata_store()
+    dois = list(dict.fromkeys(dois))
+    result = store.get_many(dois)
+    missing = [doi for doi in dois if doi not in result]
+    if len(missing) == 0:
+        return result
+
+    session = get_session(max_workers)
+    rate_limiter = RateLimiter(rate)
+    fetched = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fetch_metadata, resolve_doi(doi, doi_cache), session, rate_limiter, **kwargs): doi
+                   for doi in missing}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Downloading metadata"):
+            doi = futures[future]
+            _, metadata = future.result()
+            if metadata is None:
+                print(f"CrossRef error: could not load metadata for {doi}")
+            fetched[doi] = metadata
+            # save in batches so that an interrupted download does not lose everything
+            if len(fetched) >= 100:
+                store.put_many(fetched)
+                result.update(fetched)
+                fetched = {}
+    store.put_many(fetched)
+    result.update(fetched)
+    return result
+
 def extract_metadata_from_filename(input_string):
     pattern = r'^(?P<author>.*?)\s\((?P<year>\d{4})\)\s(?P<title>.*)\.txt$'
     match = re.match(pattern, input_string)
@@ -117,62 +531,326 @@ def extract_metadata_from_filename(input_string):
 def truncate(s, x):
     return s[:x] + '...' if len(s) > x else s
 
-def create_corpus(corpus_dir, doi_cache : DOICache=None) -> pd.DataFrame:
-    articles = []
-    for filename in tqdm(os.listdir(corpus_dir), desc="Analyzing article corpus"):
-        file_path = os.path.join(corpus_dir, filename)
-        if os.path.isfile(file_path) and filename.endswith('.txt'):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-                if filename.startswith('10.'):
-                    doi = filename.replace('_', '/', 1).strip('.txt')
-                    if doi_cache is not None:
-                        year = doi_cache.get_year(doi)
-                        if year is None:
-                            # try extended doi
-                            doi = f"{doi}.x"
-                            year = doi_cache.get_year(doi)
-                        title = author = None
-                    metadata = get_metadata(doi, doi_cache)
-                    if metadata is not None:
-                        year = extract_year(metadata)
-                        title = metadata.get('title',[None])[0]
-                        author = extract_author(metadata)
-                    else:
-                        continue
-                    articles.append({
-                        'doi': doi,
-                        'text': text,
-                        'year': year,
-                        'title': title,
-                        'author': author
-                    })
-                elif (metadata := extract_metadata_from_filename(filename)) is not None:
-                    author, year, title = metadata
-                    articles.append({
-                        'doi': None,
-                        'text': text,
-                        'year': year,
-                        'title': title,
-                        'author': author
-                    })
-    return pd.DataFrame(articles).sort_values(by='year').astype({'year':'Int64'})
-
-def create_cached_corpus(cache_id:str):
+def doi_from_filename(filename, doi_cache: DOICache=None):
+    doi = filename.replace('_', '/', 1).strip('.txt')
+    if doi_cache is not None:
+        # use the complete doi from the cache, otherwise try extended doi
+        doi = doi_cache.resolve_prefix(doi) or f"{doi}.x"
+    return doi
+
+def read_article(file_path, doi=None, metadata=None):
+    """
+    Read an article file and return a dict with its text and metadata, or None if the file
+    has no usable metadata. Files named by DOI need the CrossRef metadata of that DOI.
+    """
+    filename = os.path.basename(file_path)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        text = f.read()
+    if filename.startswith('10.'):
+        if metadata is None:
+            return None
+        return {
+            'file': filename,
+            'doi': doi,
+            'text': text,
+            'year': extract_year(metadata),
+            'title': metadata.get('title',[None])[0],
+            'author': extract_author(metadata)
+        }
+    elif (metadata := extract_metadata_from_filename(filename)) is not None:
+        author, year, title = metadata
+        return {
+            'file': filename,
+            'doi': None,
+            'text': text,
+            'year': year,
+            'title': title,
+            'author': author
+        }
+    return None
+
+def list_corpus_files(corpus_dir):
+    return [filename for filename in os.listdir(corpus_dir)
+            if filename.endswith('.txt') and os.path.isfile(os.path.join(corpus_dir, filename))]
+
+def create_corpus(corpus_dir, doi_cache : DOICache=None, workers: int = None, chunk_size=500,
+                  filenames: list = None, include_file=False) -> pd.DataFrame:
+    """
+    Create a DataFrame with the texts and metadata of the articles in corpus_dir. If `workers` is
+    greater than 1, the files are read by a pool of that many processes. The articles are collected
+    in DataFrame chunks of `chunk_size` rows, in the order of the files, so the result is the same
+    as when reading the files serially. `filenames` restricts the corpus to the given files,
+    `include_file` adds a column with the name of the file each article was read from.
+    """
+    if filenames is None:
+        filenames = list_corpus_files(corpus_dir)
+    dois = [doi_from_filename(filename, doi_cache) if filename.startswith('10.') else None
+            for filename in filenames]
+    # download the metadata of all articles in one go before parsing the files
+    all_metadata = get_metadata_many([doi for doi in dois if doi is not None], doi_cache)
+    file_paths = [os.path.join(corpus_dir, filename) for filename in filenames]
+    metadata = [all_metadata.get(doi) if doi is not None else None for doi in dois]
+
+    executor = None
+    if workers is not None and workers > 1 and len(file_paths) > 0:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        articles = executor.map(read_article, file_paths, dois, metadata,
+                                chunksize=max(1, len(file_paths) // (workers * 4)))
+    else:
+        articles = map(read_article, file_paths, dois, metadata)
+
+    chunks = []
+    chunk = []
+    try:
+        for article in tqdm(articles, total=len(file_paths), desc="Analyzing article corpus"):
+            if article is not None:
+                chunk.append(article)
+            if len(chunk) >= chunk_size:
+                chunks.append(pd.DataFrame(chunk))
+                chunk = []
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    chunks.append(pd.DataFrame(chunk, columns=['file', 'doi', 'text', 'year', 'title', 'author']))
+    articles_df = pd.concat(chunks, ignore_index=True).sort_values(by='year').astype({'year':'Int64'})
+    if not include_file:
+        articles_df = articles_df.drop(columns='file')
+    return articles_df
+
+def file_hash(file_path):
+    h = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    return h.hexdigest()
+
+def atomic_write(file_path, write, mode='wb'):
+    """
+    Call write() with a temporary file which then replaces file_path, so that an interrupted
+    write never leaves a corrupt file behind
+    """
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, mode=mode) as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+def update_corpus_manifest(corpus_dir, manifest: dict):
+    """
+    Compare the files in corpus_dir with the manifest (file name -> size, mtime, sha1) and
+    return the updated manifest, the names of new or changed files and the names of deleted files.
+    The content hash is only computed for files whose size or mtime has changed.
+    """
+    new_manifest = {}
+    changed = []
+    for filename in list_corpus_files(corpus_dir):
+        stat = os.stat(os.path.join(corpus_dir, filename))
+        entry = manifest.get(filename)
+        if entry is not None and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            new_manifest[filename] = entry
+            continue
+        sha1 = file_hash(os.path.join(corpus_dir, filename))
+        if entry is None or entry['sha1'] != sha1:
+            changed.append(filename)
+        new_manifest[filename] = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha1': sha1}
+    deleted = [filename for filename in manifest if filename not in new_manifest]
+    return new_manifest, changed, deleted
+
+class CorpusTexts:
+    """
+    Read-only access to the texts of a cached corpus, which are stored as one UTF-8 blob with an
+    array of offsets. The blob is memory-mapped, so that it is shared through the page cache by all
+    processes using it, and each text is only decoded when it is accessed.
+    """
+    def __init__(self, blob_path, offsets):
+        self.blob_path = blob_path
+        self.offsets = offsets
+        with open(blob_path, 'rb') as f:
+            self.blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(blob_path) > 0 else b''
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def __deepcopy__(self, memo):
+        # read-only, so that copies of a frame holding it in attrs share the mapping
+        return self
+
+    def __reduce__(self):
+        return CorpusTexts, (self.blob_path, self.offsets)
+
+    def select(self, text_ids) -> 'TextSelection':
+        return TextSelection(self, text_ids)
+
+class TextSelection:
+    """
+    The texts with the given ids of a CorpusTexts, in that order, decoded when accessed
+    """
+    def __init__(self, texts: CorpusTexts, text_ids):
+        self.texts = texts
+        self.text_ids = np.asarray(text_ids, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.text_ids)
+
+    def __getitem__(self, i):
+        return self.texts[self.text_ids[i]]
+
+    def __iter__(self):
+        for text_id in self.text_ids:
+            yield self.texts[text_id]
+
+def article_texts(articles_df, column='text'):
+    """
+    Return the texts of the articles as a sequence: the `column` if the frame has one, otherwise the
+    texts of a frame returned by create_cached_corpus(), which are decoded one by one when accessed
+    """
+    if column in articles_df:
+        return articles_df[column].tolist()
+    texts = articles_df.attrs.get('texts')
+    if texts is None or 'text_id' not in articles_df:
+        raise ValueError(f"The frame has neither a '{column}' column nor the texts of a cached corpus")
+    return texts.select(articles_df['text_id'])
+
+def text_keys(articles_df, column='text') -> list:
+    """
+    Return keys identifying the content of the texts of the articles, for caching results computed from
+    them: the SHA-1 of each text of the `column`, or for a frame returned by create_cached_corpus() with
+    lazily decoded texts, the blob and text id, which are known without decoding the texts (the texts of
+    a changed corpus are written to a new blob)
+    """
+    if column in articles_df:
+        return [hashlib.sha1(text.encode('utf-8')).hexdigest() for text in articles_df[column]]
+    texts = articles_df.attrs.get('texts')
+    if texts is None or 'text_id' not in articles_df:
+        raise ValueError(f"The frame has neither a '{column}' column nor the texts of a cached corpus")
+    return [(texts.blob_path, text_id) for text_id in articles_df['text_id'].tolist()]
+
+class LRUCache:
+    """
+    Mapping which keeps only the `maxsize` most recently used entries
+    """
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        if key not in self.data:
+            return default
+        self.data.move_to_end(key)
+        return self.data[key]
+
+    def __setitem__(self, key, value):
+        self.data[key] = value
+        self.data.move_to_end(key)
+        if len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+def write_corpus_texts(texts, blob_path):
+    # write the texts as a single blob and return the offsets of each text in it
+    offsets = [0]
+    def write(f):
+        for text in texts:
+            offsets.append(offsets[-1] + f.write(text.encode('utf-8')))
+    atomic_write(blob_path, write)
+    return np.array(offsets, dtype=np.int64)
+
+def load_corpus_index(cache_id: str):
+    """
+    Return the cached metadata frame of a corpus (with 'file' and 'text_id' columns) and its texts,
+    or (None, None) if the corpus has not been cached yet
+    """
+    index_file_path = f'cache/{cache_id}.corpus.pkl'
+    if not os.path.exists(index_file_path):
+        return None, None
+    with open(index_file_path, mode='rb') as f:
+        index = pickle.load(f)
+    return index['articles'], CorpusTexts(os.path.join('cache', index['blob']), index['offsets'])
+
+def load_corpus_texts(cache_id: str) -> CorpusTexts:
+    """
+    Return the lazily decoded texts of a cached corpus, to be indexed by the 'text_id' column of
+    create_cached_corpus(cache_id)
+    """
+    return load_corpus_index(cache_id)[1]
+
+def create_cached_corpus(cache_id:str, workers: int = None, lazy_text=False):
+    """
+    Return the corpus DataFrame for the given id. The metadata is cached in cache/{cache_id}.corpus.pkl,
+    the texts in a memory-mapped blob (see CorpusTexts). If `lazy_text` is true, the frame has a 'text_id'
+    column instead of the 'text' column, and the texts are decoded only when accessed through
+    article_texts(articles_df), which finds them in articles_df.attrs['texts'].
+    A manifest of the corpus files is stored in cache/{cache_id}.manifest.json, and only files which
+    were added, changed or deleted since the cache was written are re-ingested.
+    """
     corpus_dir = os.getenv(f"{cache_id.upper()}_CORPUS_DIR")
     if not os.path.exists(corpus_dir):
         raise RuntimeError(f"Invalid corpus dir '{corpus_dir}'")
-    cache_file_path = f'cache/{cache_id}.pkl'
-    if not os.path.exists(cache_file_path):
-        doi_cache_file = f"data/{cache_id}-doi-to-year.csv"
-        doi_cache = DOICache(doi_cache_file) if os.path.exists(doi_cache_file) else None
-        articles_df = create_corpus(corpus_dir, doi_cache)
-        with open(cache_file_path, mode='wb') as f:
-            pickle.dump(articles_df, f)
+    index_file_path = f'cache/{cache_id}.corpus.pkl'
+    manifest_file_path = f'cache/{cache_id}.manifest.json'
+
+    manifest = {}
+    articles_df, texts = load_corpus_index(cache_id)
+    if articles_df is not None and os.path.exists(manifest_file_path):
+        with open(manifest_file_path, mode='r') as f:
+            manifest = json.load(f)
     else:
-        with open(cache_file_path, mode='rb') as f:
-            articles_df = pickle.load(f)
-    return articles_df
+        articles_df = texts = None
+
+    manifest, changed, deleted = update_corpus_manifest(corpus_dir, manifest)
+    if articles_df is None or len(changed) > 0 or len(deleted) > 0:
+        if len(changed) > 0:
+            doi_cache_file = f"data/{cache_id}-doi-to-year.csv"
+            doi_cache = DOICache(doi_cache_file) if os.path.exists(doi_cache_file) else None
+            new_df = create_corpus(corpus_dir, doi_cache, workers=workers, filenames=changed, include_file=True)
+        else:
+            new_df = None
+        if articles_df is not None:
+            articles_df = articles_df.loc[~articles_df['file'].isin(changed + deleted)]
+            articles_df = articles_df.assign(text=[texts[i] for i in articles_df['text_id']]).drop(columns='text_id')
+            if new_df is not None:
+                articles_df = pd.concat([articles_df, new_df], ignore_index=True)
+        else:
+            articles_df = new_df
+        # the same order after incremental updates as after a full rebuild, as text_id follows the rows
+        articles_df = articles_df.sort_values(by=['year', 'file'], kind='stable', ignore_index=True) \
+            .astype({'year': 'Int64'})
+
+        # write the texts to a new blob, then the metadata pointing to it, then the manifest, so that
+        # an interrupted run never leaves a corrupt cache and re-ingests the changes
+        os.makedirs('cache', exist_ok=True)
+        blob = f'{cache_id}.texts.{uuid.uuid4().hex[:8]}.bin'
+        offsets = write_corpus_texts(articles_df['text'], os.path.join('cache', blob))
+        articles_df = articles_df.drop(columns='text').assign(text_id=np.arange(len(articles_df)))
+        index = {'articles': articles_df, 'blob': blob, 'offsets': offsets}
+        atomic_write(index_file_path, lambda f: pickle.dump(index, f))
+        atomic_write(manifest_file_path, lambda f: json.dump(manifest, f), mode='w')
+        if texts is not None:
+            try:
+                os.remove(texts.blob_path)
+            except OSError:
+                pass
+        texts = CorpusTexts(os.path.join('cache', blob), offsets)
+
+    articles_df = articles_df.drop(columns='file')
+    if lazy_text:
+        articles_df.attrs['texts'] = texts
+        return articles_df
+    articles_df.insert(articles_df.columns.get_loc('doi') + 1, 'text', [texts[i] for i in articles_df['text_id']])
+    return articles_df.drop(columns='text_id')
 
 def df_to_html(df, file=None):
 
@@ -0,0 +1,118 @@
+import importlib.util
+import os
+import sys
+
+import pytest
+
+SCRIPTS_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'scripts')
+
+
+@pytest.fixture(scope='module')
+def csv_to_neo4j():
+    # the script is run from the scripts directory and imports utils from there
+    sys.path.insert(0, SCRIPTS_DIR)
+    try:
+        spec = importlib.util.spec_from_file_location('csv_to_neo4j', os.path.join(SCRIPTS_DIR, 'csv-to-neo4j.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(SCRIPTS_DIR)
+    return module
+
+
+HEADER = 'item_id,pubyear,item_title,source_title,first_author,item_id_cited,extra\n'
+ROWS = [
+    'W1,1990,"A title",JLS,Smith,W9,x\n',
+    'W1,1990,"A title",JLS,Smith,W8,x\n',
+    'W2,1991,"A title ""quoted""\nover two lines",JLS,Jones,W1,x\n',
+    'W3,,"",,,,x\n',
+    'W4,1993,"Three\n\nlines",Other,Smith,,x\n',
+]
+
+
+def write_csv(tmp_path, rows=ROWS):
+    file_path = tmp_path / 'wos.csv'
+    file_path.write_text(HEADER + ''.join(rows), encoding='utf-8')
+    return str(file_path)
+
+
+class FakeTransaction:
+    def __init__(self, graph):
+        self.graph = graph
+
+    def run(self, query, **parameters):
+        self.graph.runs.append((query, parameters))
+
+
+class FakeGraph:
+    def __init__(self):
+        self.runs = []
+        self.transactions = 0
+        self.commits = 0
+
+    def begin(self):
+        self.transactions += 1
+        return FakeTransaction(self)
+
+    def commit(self, tx):
+        self.commits += 1
+
+
+def test_read_batches_keeps_multiline_fields(csv_to_neo4j, tmp_path):
+    file_path = write_csv(tmp_path)
+    batches = list(csv_to_neo4j.read_batches(file_path, 2))
+    assert [len(rows) for rows, _ in batches] == [2, 2, 1]
+    assert list(batches[0][0].columns) == list(csv_to_neo4j.SCHEMA)
+    assert batches[1][0]['item_title'].tolist()[0] == 'A title "quoted"\nover two lines'
+    assert batches[2][0]['item_title'].tolist() == ['Three\n\nlines']
+    assert batches[-1][1] == os.path.getsize(file_path)
+
+
+def test_read_batches_resumes_at_offset(csv_to_neo4j, tmp_path):
+    file_path = write_csv(tmp_path)
+    rows, offset = next(csv_to_neo4j.read_batches(file_path, 2))
+    # the checkpoint offset is the start of the row after the batch, even after a multi-line field
+    resumed = list(csv_to_neo4j.read_batches(file_path, 10, offset))
+    assert len(resumed) == 1
+    assert resumed[0][0]['item_id'].tolist() == ['W2', 'W3', 'W4']
+    _, offset = next(csv_to_neo4j.read_batches(file_path, 3))
+    assert next(csv_to_neo4j.read_batches(file_path, 10, offset))[0]['item_id'].tolist() == ['W3', 'W4']
+    # rows can be skipped after the header or after an offset
+    assert next(csv_to_neo4j.read_batches(file_path, 10, skip_rows=3))[0]['item_id'].tolist() == ['W3', 'W4']
+    assert next(csv_to_neo4j.read_batches(file_path, 10, offset, skip_rows=1))[0]['item_id'].tolist() == ['W4']
+    assert list(csv_to_neo4j.read_batches(file_path, 10, offset, skip_rows=2)) == []
+
+
+def test_import_batch_runs_each_query_once_in_one_transaction(csv_to_neo4j, tmp_path):
+    rows, _ = next(csv_to_neo4j.read_batches(write_csv(tmp_path), 10))
+    graph = FakeGraph()
+    csv_to_neo4j.import_batch(graph, rows)
+    assert graph.transactions == graph.commits == 1
+    parameters = {query: parameters['rows'] for query, parameters in graph.runs}
+    queries = csv_to_neo4j.BULK_QUERIES
+    assert list(parameters) == list(queries.values())
+    assert parameters[queries['works']] == [
+        {'id': 'W1', 'year': 1990, 'title': 'A title'},
+        {'id': 'W2', 'year': 1991, 'title': 'A title "quoted"\nover two lines'},
+        {'id': 'W3', 'year': None, 'title': None},
+        {'id': 'W4', 'year': 1993, 'title': 'Three\n\nlines'},
+    ]
+    assert parameters[queries['cited_works']] == ['W9', 'W8']
+    assert parameters[queries['venues']] == ['JLS', 'Other']
+    assert parameters[queries['authors']] == ['Smith', 'Jones']
+    assert parameters[queries['published_in']] == [['W1', 'JLS'], ['W2', 'JLS'], ['W4', 'Other']]
+    assert parameters[queries['creator_of']] == [['Smith', 'W1'], ['Jones', 'W2'], ['Smith', 'W4']]
+    assert parameters[queries['cites']] == [['W1', 'W9'], ['W1', 'W8'], ['W2', 'W1']]
+
+
+def test_import_batch_skips_empty_parameters(csv_to_neo4j, tmp_path):
+    rows, _ = next(csv_to_neo4j.read_batches(write_csv(tmp_path, [ROWS[3]]), 10))
+    graph = FakeGraph()
+    csv_to_neo4j.import_batch(graph, rows)
+    assert [query for query, _ in graph.runs] == [csv_to_neo4j.BULK_QUERIES['works']]
+
+
+def test_missing_values_do_not_replace_properties(csv_to_neo4j, tmp_path):
+    rows, _ = next(csv_to_neo4j.read_batches(write_csv(tmp_path, [ROWS[0], 'W1,,,,,,x\n']), 10))
+    assert csv_to_neo4j.batch_parameters(rows)['works'] == [{'id': 'W1', 'year': 1990, 'title': 'A title'}]
+    assert 'coalesce(r.year, w.year)' in csv_to_neo4j.BULK_QUERIES['works']
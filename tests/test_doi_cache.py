@@ -0,0 +1,24 @@
+from scripts.utils import DOICache, doi_from_filename
+
+
+def write_doi_table(tmp_path, rows):
+    file_path = tmp_path / 'doi-to-year.csv'
+    file_path.write_text('year,"DOI"\n' + ''.join(f'{year},"{doi}"\n' for doi, year in rows))
+    return str(file_path)
+
+
+def test_resolve_prefix_does_not_match_longer_doi(tmp_path):
+    doi_cache = DOICache(write_doi_table(tmp_path, [('10.2307/12345', 1990), ('10.1111/1467-6478.00033.x', 1997)]))
+    assert doi_cache.resolve_prefix('10.2307/1234') is None
+    assert doi_cache.resolve_prefix('10.2307/12345') == '10.2307/12345'
+    assert doi_cache.resolve_prefix('10.1111/1467-6478.00033') == '10.1111/1467-6478.00033.x'
+    assert doi_cache.get_year_many(['10.2307/1234', '10.2307/12345']) == {'10.2307/1234': None, '10.2307/12345': 1990}
+    assert doi_from_filename('10.2307_1234.txt', doi_cache) == '10.2307/1234.x'
+
+
+def test_resolve_prefix_prefers_exact_doi(tmp_path):
+    doi_cache = DOICache(write_doi_table(tmp_path, [('10.1/a.x', 1990), ('10.1/a', 1991), ('10.1/b', 1992)]))
+    assert doi_cache.normalized == {'10.1/a': '10.1/a', '10.1/b': '10.1/b'}
+    assert doi_cache.resolve_prefix('10.1/a') == '10.1/a'
+    assert doi_cache.resolve_prefix('10.1/a.x') == '10.1/a.x'
+    assert doi_cache.resolve_prefix('10.1/b.x') == '10.1/b'
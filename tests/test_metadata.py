@@ -0,0 +1,123 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from scripts import utils
+from scripts.utils import SQLiteMetadataStore, fetch_metadata, get_metadata_many, get_session
+
+
+class StubCrossRef:
+    """
+    Local HTTP server answering /works/<doi> requests with the queued (status, metadata) responses of the DOI,
+    or 404 once they are used up. Requests are recorded as (doi, client address).
+    """
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                doi = self.path.split('?')[0][len('/works/'):]
+                stub.requests.append((doi, self.client_address))
+                queued = stub.responses.get(doi)
+                status, metadata = queued.pop(0) if queued else (404, None)
+                body = json.dumps({'message': metadata}).encode() if metadata is not None else b'Resource not found.'
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def requested_dois(self):
+        return [doi for doi, _ in self.requests]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def crossref(monkeypatch):
+    stub = StubCrossRef()
+    monkeypatch.setattr(utils, 'CROSSREF_API_URL', stub.url)
+    monkeypatch.setattr(utils, '_session', None)
+    yield stub
+    stub.close()
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = SQLiteMetadataStore(str(tmp_path / 'metadata.sqlite'), migrate_from=None)
+    monkeypatch.setattr(utils, '_metadata_store', store)
+    # the notebook progress bar needs ipywidgets
+    monkeypatch.setattr(utils, 'tqdm', lambda iterable, **kwargs: iterable)
+    return store
+
+
+def test_fetch_metadata_backs_off_on_429(crossref, monkeypatch):
+    delays = []
+    monkeypatch.setattr(utils.time, 'sleep', delays.append)
+    crossref.responses['10.1/a'] = [(429, None), (503, None), (200, {'title': ['A']})]
+    assert fetch_metadata('10.1/a', retries=3, backoff=1) == ('10.1/a', {'title': ['A']})
+    assert crossref.requested_dois() == ['10.1/a'] * 3
+    assert delays == [1, 2]
+
+
+def test_fetch_metadata_gives_up_after_retries(crossref, monkeypatch):
+    monkeypatch.setattr(utils.time, 'sleep', lambda delay: None)
+    crossref.responses['10.1/a'] = [(429, None)] * 5
+    assert fetch_metadata('10.1/a', retries=2) == ('10.1/a', None)
+    assert len(crossref.requests) == 2
+
+
+def test_fetch_metadata_tries_x_variant(crossref):
+    crossref.responses['10.1/b.x'] = [(200, {'title': ['B']})]
+    assert fetch_metadata('10.1/b') == ('10.1/b.x', {'title': ['B']})
+    assert crossref.requested_dois() == ['10.1/b', '10.1/b.x']
+
+
+def test_session_is_reused(crossref):
+    assert get_session() is get_session()
+    for doi in ['10.1/a', '10.1/b', '10.1/c']:
+        crossref.responses[doi] = [(200, {'title': [doi]})]
+        fetch_metadata(doi)
+    # all requests are sent over the same keep-alive connection
+    assert len({address for _, address in crossref.requests}) == 1
+
+
+def test_failed_lookups_are_cached_until_negative_ttl(crossref, store):
+    crossref.responses['10.1/a'] = [(200, {'title': ['A']})]
+    assert get_metadata_many(['10.1/a', '10.1/missing'], max_workers=2) == {'10.1/a': {'title': ['A']},
+                                                                          '10.1/missing': None}
+    assert crossref.requested_dois() == ['10.1/a', '10.1/missing', '10.1/missing.x']
+
+    # both the metadata and the failed lookup are served from the store
+    assert get_metadata_many(['10.1/a', '10.1/missing']) == {'10.1/a': {'title': ['A']}, '10.1/missing': None}
+    assert len(crossref.requests) == 3
+
+    # once the negative entry has expired, the DOI is fetched again
+    store.put_many({'10.1/missing': None}, fetched=1.0)
+    crossref.responses['10.1/missing'] = [(200, {'title': ['M']})]
+    assert get_metadata_many(['10.1/a', '10.1/missing'])['10.1/missing'] == {'title': ['M']}
+    assert crossref.requested_dois()[3:] == ['10.1/missing']
+    assert store.get_many(['10.1/missing']) == {'10.1/missing': {'title': ['M']}}
+
+
+def test_negative_ttl(tmp_path):
+    store = SQLiteMetadataStore(str(tmp_path / 'metadata.sqlite'), negative_ttl=60, migrate_from=None)
+    store.put_many({'10.1/old': None}, fetched=utils.time.time() - 120)
+    store.put_many({'10.1/new': None, '10.1/ok': {'title': ['OK']}})
+    assert store.get_many(['10.1/old', '10.1/new', '10.1/ok', '10.1/unknown']) == {'10.1/new': None,
+                                                                                  '10.1/ok': {'title': ['OK']}}